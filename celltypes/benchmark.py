@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import numpy as np
+import vtk
+
+import swcio
+import xform
+import vtkmorph
+import make_tubes
+
+# synthetic reconstruction with n compartments.  compartment i continues
+# compartment i-1 unless it branches off a random earlier compartment, which
+# happens with probability branch_probability.
+def synthetic_swc_array(n, branch_probability=0.05, seed=0):
+    rng = np.random.RandomState(seed)
+
+    index = np.arange(n)
+    parent = index - 1
+    branch = (rng.rand(n) < branch_probability) & (index > 1)
+    parent[branch] = (rng.rand(branch.sum()) * index[branch]).astype(np.int64)
+
+    # positions are a random walk down the tree: sum the steps over all
+    # ancestors by pointer jumping
+    xyz = rng.randn(n, 3) * 2.0
+    xyz[0] = 0
+    ancestor = parent.copy()
+    while True:
+        jump = np.nonzero(ancestor >= 0)[0]
+        if jump.size == 0:
+            break
+        xyz[jump] += xyz[ancestor[jump]]
+        ancestor[jump] = ancestor[ancestor[jump]]
+
+    types = np.where(index < n // 3, 2, np.where(index < 2 * n // 3, 3, 4))
+    types[0] = 1
+
+    radius = 0.2 + rng.rand(n)
+    radius[0] = 10.0
+
+    values = np.empty((n, swcio.SWC_COLUMNS))
+    values[:,0] = index + 1
+    values[:,1] = types
+    values[:,2:5] = xyz
+    values[:,5] = radius
+    values[:,6] = np.where(parent >= 0, parent + 1, -1)
+
+    return values
+
+def write_swc(file_name, values):
+    np.savetxt(file_name, values, fmt="%d %d %.4f %.4f %.4f %.4f %d")
+
+class Timer(object):
+    def __init__(self):
+        self.stages = {}
+
+    def time(self, name, fn, *args, **kwargs):
+        start = time.time()
+        result = fn(*args, **kwargs)
+        self.stages[name] = time.time() - start
+        return result
+
+def run_pipeline(swc_file, ply_file, sides=6):
+    timer = Timer()
+
+    morphology = timer.time('parse', swcio.read_swc, swc_file, use_sidecar=False)
+
+    root = morphology.xyz[morphology.root_index]
+    m = xform.compose(xform.scale3(.001, .001, .001),
+                      xform.rotate3x(np.pi * 0.5),
+                      xform.scale3(1, 1, 3),
+                      xform.translate3(-root[0], -root[1], -root[2]))
+    timer.time('transform', morphology.transform, m)
+
+    apicals = morphology.xyz[morphology.types == 4]
+    timer.time('align_apical_dendrite', make_tubes.align_apical_dendrite, apicals, morphology.xyz[morphology.root_index])
+
+    pd = timer.time('morphology_polydata', vtkmorph.morphology_polydata, morphology, morphology.root, make_tubes.COLORS)
+    clean_pd = timer.time('clean', vtkmorph.clean_polydata, pd)
+    tube_pd = timer.time('tube', vtkmorph.tube_lines, clean_pd, sides)
+    tri_pd = timer.time('triangle_filter', vtkmorph.triangle_polydata, tube_pd)
+    timer.time('ply_write', vtkmorph.write_triangle_ply, tri_pd, ply_file)
+
+    return timer.stages, tri_pd.GetNumberOfCells()
+
+def run(sizes, branch_probability, repeat, work_dir):
+    results = []
+
+    for n in sizes:
+        swc_file = os.path.join(work_dir, "synthetic_%d.swc" % n)
+        ply_file = os.path.join(work_dir, "synthetic_%d.ply" % n)
+        write_swc(swc_file, synthetic_swc_array(n, branch_probability))
+
+        # keep the fastest run of each stage
+        best = {}
+        for _ in range(repeat):
+            stages, num_triangles = run_pipeline(swc_file, ply_file)
+            for name, seconds in stages.items():
+                best[name] = min(seconds, best.get(name, seconds))
+
+        results.append({ 'compartments': n,
+                         'branch_probability': branch_probability,
+                         'triangles': num_triangles,
+                         'ply_bytes': os.path.getsize(ply_file),
+                         'stages': best,
+                         'total': sum(best.values()) })
+
+        print("%d compartments: %.3fs" % (n, results[-1]['total']))
+        for name in sorted(best, key=best.get, reverse=True):
+            print("  %-22s %.4fs" % (name, best[name]))
+
+        os.remove(swc_file)
+        os.remove(ply_file)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--branch_probability', type=float, default=0.05)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--work_dir', default=None)
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='blenderspin_bench')
+
+    try:
+        results = run(args.sizes, args.branch_probability, args.repeat, work_dir)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = { 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'platform': platform.platform(),
+               'python': sys.version.split()[0],
+               'numpy': np.__version__,
+               'vtk': vtk.vtkVersion.GetVTKVersion(),
+               'results': results }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == "__main__": main()
@@ -0,0 +1,168 @@
+import numpy as np
+
+SOMA = 1
+
+# structure-of-arrays morphology.  compartment i has id ids[i], parent id
+# parents[i] (-1 for roots) and parent_index[i], the array index of its parent
+# (-1 for roots and for compartments whose parent is missing).  the children of
+# compartment i are child_index[child_offsets[i]:child_offsets[i+1]], in the
+# order they appear in the source file.
+class CompactMorphology(object):
+    def __init__(self, ids, parents, types, xyz, radius):
+        self.ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.parents = np.ascontiguousarray(parents, dtype=np.int64)
+        self.types = np.ascontiguousarray(types, dtype=np.uint8)
+        self.xyz = np.ascontiguousarray(xyz, dtype=np.float64).reshape(-1,3)
+        self.radius = np.ascontiguousarray(radius, dtype=np.float64)
+
+        n = self.ids.size
+
+        # look up parent ids
+        sorter = np.argsort(self.ids, kind='mergesort')
+        sorted_ids = self.ids[sorter]
+        if n > 0:
+            pos = np.minimum(np.searchsorted(sorted_ids, self.parents), n-1)
+            found = (sorted_ids[pos] == self.parents) & (self.parents != -1)
+            self.parent_index = np.where(found, sorter[pos], -1).astype(np.int64)
+        else:
+            self.parent_index = np.zeros(0, dtype=np.int64)
+
+        # csr children, stable so siblings stay in file order
+        child = np.nonzero(self.parent_index >= 0)[0]
+        child_parent = self.parent_index[child]
+        self.child_index = child[np.argsort(child_parent, kind='mergesort')]
+        self.child_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(child_parent, minlength=n), out=self.child_offsets[1:])
+
+        self._sorter = sorter
+        self._sorted_ids = sorted_ids
+
+    @classmethod
+    def from_compartments(cls, compartments):
+        compartments = list(compartments)
+        return cls([ c['id'] for c in compartments ],
+                   [ c['parent'] for c in compartments ],
+                   [ c['type'] for c in compartments ],
+                   [ (c['x'], c['y'], c['z']) for c in compartments ],
+                   [ c['radius'] for c in compartments ])
+
+    @classmethod
+    def from_morphology(cls, morphology):
+        return cls.from_compartments(morphology.compartment_list)
+
+    def __len__(self):
+        return self.ids.size
+
+    def index_of(self, compartment_id):
+        pos = np.searchsorted(self._sorted_ids, compartment_id)
+        if pos < len(self) and self._sorted_ids[pos] == compartment_id:
+            return int(self._sorter[pos])
+        raise KeyError(compartment_id)
+
+    def children(self, i):
+        return self.child_index[self.child_offsets[i]:self.child_offsets[i+1]]
+
+    @property
+    def roots(self):
+        return np.nonzero(self.parents == -1)[0]
+
+    # the soma if there is one, otherwise the first root
+    @property
+    def root_index(self):
+        somas = np.nonzero(self.types == SOMA)[0]
+        if len(somas):
+            return int(somas[0])
+        roots = self.roots
+        return int(roots[0]) if len(roots) else None
+
+    @property
+    def root(self):
+        i = self.root_index
+        return None if i is None else self.node(i)
+
+    # a compartment as the dict the allensdk morphology would hold
+    def node(self, i):
+        return { 'id': int(self.ids[i]),
+                 'parent': int(self.parents[i]),
+                 'type': int(self.types[i]),
+                 'x': float(self.xyz[i,0]),
+                 'y': float(self.xyz[i,1]),
+                 'z': float(self.xyz[i,2]),
+                 'radius': float(self.radius[i]),
+                 'children': self.ids[self.children(i)].tolist() }
+
+    # same visiting order as vtkmorph.preorder_traversal
+    def preorder(self, start):
+        child_offsets = self.child_offsets.tolist()
+        child_index = self.child_index.tolist()
+
+        order = []
+        stack = [ start ]
+        while stack:
+            i = stack.pop()
+            order.append(i)
+            stack.extend(child_index[child_offsets[i]:child_offsets[i+1]])
+
+        return np.array(order, dtype=np.int64)
+
+    def transform(self, transform, radius_scale=1.0):
+        transform = np.asarray(transform, dtype=np.float64)
+        self.xyz = np.dot(self.xyz, transform[:3,:3].T) + transform[:3,3]
+        self.radius *= radius_scale
+        return self
+
+    # number of ancestors of every compartment, by pointer jumping
+    def depth(self):
+        depth = (self.parent_index >= 0).astype(np.int64)
+        ancestor = self.parent_index.copy()
+
+        while True:
+            jump = np.nonzero(ancestor >= 0)[0]
+            if jump.size == 0:
+                return depth
+            depth[jump] += depth[ancestor[jump]]
+            ancestor[jump] = ancestor[ancestor[jump]]
+
+    # merge away compartments that lie on the segment between their parent
+    # and their only child, to within tolerance times their own radius.  each
+    # pass only removes compartments at even or at odd depth, so a compartment
+    # and its parent never go together and every removal is measured against
+    # compartments that are still there.
+    def decimate(self, tolerance, max_passes=64):
+        m = self
+
+        for i in range(max_passes):
+            n = len(m)
+            num_children = np.diff(m.child_offsets)
+
+            idx = np.nonzero((num_children == 1) & (m.parent_index >= 0) & (m.types != SOMA))[0]
+            child = m.child_index[m.child_offsets[idx]]
+            parent = m.parent_index[idx]
+
+            p = m.xyz[parent]
+            d = m.xyz[child] - p
+            t = np.einsum('ij,ij->i', m.xyz[idx] - p, d) / np.maximum(np.einsum('ij,ij->i', d, d), 1e-12)
+            closest = p + np.clip(t, 0, 1)[:,np.newaxis] * d
+            dist = np.sqrt(np.sum((closest - m.xyz[idx])**2, axis=1))
+
+            ok = (dist <= tolerance * m.radius[idx]) & \
+                 (m.types[child] == m.types[idx]) & (m.types[parent] == m.types[idx])
+
+            if not ok.any():
+                break
+
+            remove = np.zeros(n, dtype=bool)
+            remove[idx[ok]] = True
+            remove &= (m.depth() % 2) == (i % 2)
+
+            if not remove.any():
+                continue
+
+            removed = np.nonzero(remove)[0]
+            parents = m.parents.copy()
+            parents[m.child_index[m.child_offsets[removed]]] = m.parents[removed]
+
+            keep = ~remove
+            m = CompactMorphology(m.ids[keep], parents[keep], m.types[keep], m.xyz[keep], m.radius[keep])
+
+        return m
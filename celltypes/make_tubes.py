@@ -1,11 +1,18 @@
 import sys, os, csv
 import numpy as np
-import allensdk.core.swc as swc
+import swcio
 import vtkmorph
+import meshcache
 import xform
 import math
 import argparse
 import scipy.stats
+import json
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import batch
+import filecache
 
 def read_csv(file_name):
     rows = []
@@ -25,58 +32,33 @@ def read_csv(file_name):
             }
         for r in rows }
 
-def align_apical_dendrite(morphology):
-    apicals = [ c for c in morphology.compartment_list if c['type'] == 4 ]
-    
+# apicals is an (N,3) array of apical dendrite positions, soma an xyz position
+def align_apical_dendrite(apicals, soma):
     if len(apicals) == 0:
         return np.eye(4)
 
-    y = np.array([c['y'] for c in apicals ])
-    z = np.array([c['z'] for c in apicals ])
+    y = apicals[:,1]
+    z = apicals[:,2]
 
     slope, intercept, r_value, p_value, std_err = scipy.stats.linregress(y,z)
     theta = np.arctan2(1, -slope)
 
-    print slope, theta, math.degrees(theta)
     theta = 0
     
     r = xform.rotate3x(theta)
                    
     # translate soma to origin
-    soma = morphology.root
-    t1 = np.array([[1, 0, 0, -soma['x']],
-                   [0, 1, 0, -soma['y']],
-                   [0, 0, 1, -soma['z']],
-                   [0, 0, 0, 1]])
+    t1 = xform.translate3(-soma[0], -soma[1], -soma[2])
     
     # then go back
-    t2 = np.array([[1, 0, 0, soma['x']],
-                   [0, 1, 0, soma['y']],
-                   [0, 0, 1, soma['z']],
-                   [0, 0, 0, 1]])
-
+    t2 = xform.translate3(soma[0], soma[1], soma[2])
 
-    t = t2.dot(r).dot(t1)
+    t = xform.compose(t2, r, t1)
 
     return t
 
-
 def make_transformed_morphology(morphology, transform, radius_scale=1.0):
-    #morphology.sparsify(3)
-
-    for comp in morphology.compartment_list:
-        pos = np.array([comp['x'], comp['y'], comp['z'], 1.0])
-        tpos = np.dot(transform, pos)
-
-        #if tpos[2] > (11390.0 * 0.5):
-        #    tpos[2] = 11390 - tpos[2]
-            
-        comp['x'] = tpos[0]
-        comp['y'] = tpos[1]
-        comp['z'] = tpos[2]
-        comp['radius'] = comp['radius'] * radius_scale
-
-    return morphology
+    return morphology.transform(transform, radius_scale)
 
 
 def color_by_category(specimens, key):
@@ -178,10 +160,13 @@ def fetch_cell(specimen_id):
     return swc_file, m
     
 
-def fetch_aligned_morphology(specimen_id=None, swc_file=None):
+def fetch_aligned_morphology(specimen_id=None, swc_file=None, transform=None, radius_scale=.002, save_sidecar=False):
     if specimen_id:
-        swc_file, m0 = fetch_cell(specimen_id)
-        morphology = swc.read_swc(swc_file)
+        if swc_file is None or transform is None:
+            swc_file, m0 = fetch_cell(specimen_id)
+        else:
+            m0 = transform
+        morphology = swcio.read_swc(swc_file, save_sidecar=save_sidecar)
         
         t0 = np.eye(4)
         t0[:,3] = -np.dot(m0, [ morphology.root['x'],
@@ -191,7 +176,7 @@ def fetch_aligned_morphology(specimen_id=None, swc_file=None):
         r = xform.rotate3x(math.radians(-90))
     else:
         swc_file = swc_file
-        morphology = swc.read_swc(swc_file)
+        morphology = swcio.read_swc(swc_file, save_sidecar=save_sidecar)
         m0 = np.eye(4)
         t0 = xform.translate3(-morphology.root['x'], 
                               -morphology.root['y'], 
@@ -202,20 +187,108 @@ def fetch_aligned_morphology(specimen_id=None, swc_file=None):
     sz = xform.scale3(1, 1, 3)
     sm = xform.scale3(.001, .001, .001)
     
-    m = np.dot(sm, np.dot(np.dot(r, np.dot(sz, t0)), m0))
-
-    morphology = make_transformed_morphology(morphology, m)
+    m = xform.compose(sm, r, sz, t0, m0)
 
-    # rotate the apical
-    ra = align_apical_dendrite(morphology)
+    # rotate the apical.  only the apicals and the soma need to be moved to
+    # fit the rotation, then everything is transformed once.
+    apicals = xform.transform_points(m, morphology.xyz[morphology.types == 4])
+    soma = xform.transform_points(m, morphology.xyz[[morphology.root_index]])[0]
+    ra = align_apical_dendrite(apicals, soma)
 
-    morphology = make_transformed_morphology(morphology, ra, .002)
+    morphology = make_transformed_morphology(morphology, xform.compose(ra, m), radius_scale)
 
     return morphology
 
+# returns the ply file and whether it came out of the mesh cache.  with lod,
+# the coarser levels of vtkmorph.LOD_LEVELS go to recon_lod1.ply, recon_lod2.ply, ...
+# with save_sidecar, a parsed swc leaves a binary copy next to it for next time.
+# a mesh cache hit doesn't parse the swc, so it doesn't write a sidecar either.
+def build_cell_mesh(specimen_id, output_dir, cache=None, sides=6, radius_scale=.002, lod=False, save_sidecar=False):
+    cell_dir = os.path.join(output_dir, str(specimen_id))
+
+    if not os.path.exists(cell_dir):
+        os.makedirs(cell_dir)
+
+    # swc_file = os.path.join(cell_dir, "recon.swc")
+    ply_file = os.path.join(cell_dir, "recon.ply")
+    vtk_file = os.path.join(cell_dir, "recon.vtk")
+
+    lod_levels = vtkmorph.LOD_LEVELS[1:] if lod else []
+    lod_files = [ os.path.join(cell_dir, "recon_lod%d.ply" % (i+1)) for i in range(len(lod_levels)) ]
+    out_files = { os.path.basename(f): f for f in [ ply_file, vtk_file ] + lod_files }
+
+    swc_file, m0 = fetch_cell(specimen_id)
+
+    if cache is not None:
+        key = meshcache.mesh_key(swc_file, m0, radius_scale, sides, extra=lod_levels or None)
+        if cache.get(key, out_files):
+            return ply_file, True
+
+    morphology = fetch_aligned_morphology(specimen_id=specimen_id, swc_file=swc_file, transform=m0,
+                                          radius_scale=radius_scale, save_sidecar=save_sidecar)
+
+    tube_pd = vtkmorph.generate_mesh(morphology, morphology.root, COLORS, sides, radius=None)
+    vtkmorph.write_ply(tube_pd, ply_file)
+    vtkmorph.write_vtk(tube_pd, vtk_file)
+
+    for level, lod_file in zip(lod_levels, lod_files):
+        vtkmorph.write_ply(vtkmorph.generate_lod_mesh(morphology, COLORS, **level), lod_file)
+
+    if cache is not None:
+        cache.put(key, out_files)
+
+    return ply_file, False
+
+def build_cell_mesh_task(specimen_id, output_dir, cache_dir, cache_bytes, lod, save_sidecar):
+    cache = filecache.FileCache(cache_dir, cache_bytes) if cache_dir else None
+    ply_file, cached = build_cell_mesh(specimen_id, output_dir, cache, lod=lod, save_sidecar=save_sidecar)
+    return { 'ply_file': ply_file, 'cached': cached }
+
+def describe_cell_result(result):
+    if result['error'] is not None:
+        return str(result['specimen_id'])
+    return result['ply_file'] + (", cached" if result['cached'] else "")
+
+def build_cell_meshes(specimen_ids, output_dir, workers=1, cache_dir=None, cache_bytes=None, lod=False,
+                      save_sidecar=False):
+    tasks = [ (build_cell_mesh_task,
+               (specimen_id, output_dir, cache_dir, cache_bytes, lod, save_sidecar),
+               { 'specimen_id': specimen_id, 'ply_file': None, 'cached': False })
+              for specimen_id in specimen_ids ]
+
+    return batch.run_tasks(tasks, workers, describe=describe_cell_result)
+
+def write_summary(results, wall_seconds, file_name):
+    failures = [ r for r in results if r['error'] is not None ]
+    hits = len([ r for r in results if r['cached'] ])
+
+    summary = batch.summarize(results, wall_seconds, 'cells')
+    summary.update({
+        'cache_hits': hits,
+        'cache_misses': len(results) - len(failures) - hits,
+        'failures': { str(r['specimen_id']): r['error'] for r in failures },
+        'results': sorted(results, key=lambda r: r['specimen_id'])
+        })
+
+    with open(file_name, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    batch.print_summary(summary, 'cells')
+    print("mesh cache: %d hits, %d misses" % (summary['cache_hits'], summary['cache_misses']))
+    for specimen_id in sorted(summary['failures']):
+        print("failed: %s" % specimen_id)
+
+    return summary
+
 def main_all_human():
     parser = argparse.ArgumentParser()
     parser.add_argument('output_dir', default='.')
+    parser.add_argument('--workers', default=1, type=int)
+    parser.add_argument('--no_cache', action='store_true')
+    parser.add_argument('--cache_size_mb', default=10240, type=int)
+    parser.add_argument('--lod', action='store_true')
+    parser.add_argument('--swc_sidecars', action='store_true',
+                        help='save a binary copy next to each swc parsed (not for mesh cache hits)')
     args = parser.parse_args()
 
     from allensdk.core.cell_types_cache import CellTypesCache
@@ -224,23 +297,13 @@ def main_all_human():
 
     cells = ctc.get_cells(require_reconstruction=True, species=[CellTypesApi.HUMAN])
 
-    for cell in cells:
-        morphology = fetch_aligned_morphology(specimen_id=cell['id'])
-        
-        cell_dir = os.path.join(args.output_dir, str(cell['id']))
-
-        if not os.path.exists(cell_dir):
-            os.makedirs(cell_dir)
-
-        # swc_file = os.path.join(cell_dir, "recon.swc")
-        ply_file = os.path.join(cell_dir, "recon.ply")
-        vtk_file = os.path.join(cell_dir, "recon.vtk")
-
-        tube_pd = vtkmorph.generate_mesh(morphology.compartment_index, morphology.root, color_by_type, 6, radius=None)
-        vtkmorph.write_ply(tube_pd, ply_file)
-        vtkmorph.write_vtk(tube_pd, vtk_file)
+    start = time.time()
+    cache_dir = None if args.no_cache else os.path.join(args.output_dir, "mesh_cache")
+    results = build_cell_meshes([ cell['id'] for cell in cells ], args.output_dir, workers=args.workers,
+                                cache_dir=cache_dir, cache_bytes=args.cache_size_mb * (1<<20), lod=args.lod,
+                                save_sidecar=args.swc_sidecars)
 
-        print(ply_file)
+    write_summary(results, time.time() - start, os.path.join(args.output_dir, "summary.json"))
     
 
 def main_human_pr():
@@ -254,7 +317,7 @@ def main_human_pr():
 
     base,ext = os.path.splitext(os.path.basename(swc_file))
     
-    tube_pd = vtkmorph.generate_mesh(morphology.compartment_index, morphology.root, color_by_type, 6, radius=None)
+    tube_pd = vtkmorph.generate_mesh(morphology, morphology.root, COLORS, 6, radius=None)
     vtkmorph.write_ply(tube_pd, os.path.join(args.output_dir, base + ".ply"))
     vtkmorph.write_vtk(tube_pd, os.path.join(args.output_dir, base + ".vtk"))
 
@@ -0,0 +1,30 @@
+import os
+import sys
+import hashlib
+import json
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from filecache import file_hash
+
+# bump when mesh generation changes in a way that invalidates old entries
+CACHE_VERSION = 2
+
+# the modules that read, align, color and mesh a morphology (make_tubes holds
+# the colors and the alignment).  their source is part of every key, so
+# editing them invalidates old entries without a bump.
+MESH_SOURCES = [ os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                 for name in ( 'swcio.py', 'compactmorph.py', 'xform.py', 'vtkmorph.py', 'make_tubes.py' ) ]
+
+# extra is any other json-serializable setting the meshes depend on
+def mesh_key(swc_file, transform, radius_scale, sides, extra=None):
+    h = hashlib.sha1()
+    h.update(("v%d" % CACHE_VERSION).encode('ascii'))
+    for source in MESH_SOURCES:
+        h.update(file_hash(source).encode('ascii'))
+    h.update(file_hash(swc_file).encode('ascii'))
+    h.update(np.ascontiguousarray(transform, dtype=np.float64).tobytes())
+    h.update(("%r %r" % (float(radius_scale), int(sides))).encode('ascii'))
+    if extra is not None:
+        h.update(json.dumps(extra, sort_keys=True).encode('ascii'))
+    return h.hexdigest()
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+from compactmorph import CompactMorphology
+
+# swc columns: id, type, x, y, z, radius, parent
+SWC_COLUMNS = 7
+
+# parse swc text straight into an (N,7) float64 array, a line at a time.  a
+# token that isn't a number or a row with the wrong number of columns raises.
+def read_swc_array(file_name):
+    with open(file_name, 'r') as f:
+        values = np.loadtxt(f, comments='#', ndmin=2)
+
+    if values.size == 0:
+        return np.empty((0, SWC_COLUMNS))
+
+    if values.shape[1] != SWC_COLUMNS:
+        raise ValueError("%s does not have %d columns per compartment" % (file_name, SWC_COLUMNS))
+
+    return values
+
+def sidecar_file_name(file_name):
+    return file_name + ".npy"
+
+# written next to the sidecar and renamed, so a half-written one is never loaded
+def write_sidecar(file_name, values):
+    sidecar = sidecar_file_name(file_name)
+    tmp_file = "%s.%d.tmp" % (sidecar, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        np.save(f, np.ascontiguousarray(values, dtype=np.float64))
+    os.rename(tmp_file, sidecar)
+
+# load the binary sidecar if there is one at least as new as the swc,
+# otherwise parse the text (and write a sidecar if asked to).  the sidecar is
+# read whole: CompactMorphology copies the columns out anyway.
+def load_swc_array(file_name, use_sidecar=True, save_sidecar=False):
+    sidecar = sidecar_file_name(file_name)
+
+    if use_sidecar and os.path.exists(sidecar) and \
+       os.path.getmtime(sidecar) >= os.path.getmtime(file_name):
+        return np.load(sidecar)
+
+    values = read_swc_array(file_name)
+
+    if save_sidecar:
+        try:
+            write_sidecar(file_name, values)
+        except (IOError, OSError):
+            # the swc may live somewhere read-only
+            pass
+
+    return values
+
+def compact_morphology(values):
+    return CompactMorphology(ids=values[:,0],
+                             types=values[:,1],
+                             xyz=values[:,2:5],
+                             radius=values[:,5],
+                             parents=values[:,6])
+
+def read_swc(file_name, use_sidecar=True, save_sidecar=False):
+    return compact_morphology(load_swc_array(file_name, use_sidecar, save_sidecar))
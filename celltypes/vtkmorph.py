@@ -1,7 +1,12 @@
+import os
 import sys
 import numpy as np
 import vtk
 import vtk.util.numpy_support
+from compactmorph import CompactMorphology
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import vtkcells
 
 
 def preorder_traversal(root, compartments):
@@ -26,6 +31,9 @@ def preorder_traversal(root, compartments):
     return nodelist
 
 def morphology_polydata(compartments, soma_compartment, color_fn, minRadius=0.0):
+    if isinstance(compartments, CompactMorphology):
+        return compact_morphology_polydata(compartments, color_fn, minRadius)
+
     points = vtk.vtkPoints()
     lines = vtk.vtkCellArray()
 
@@ -74,7 +82,7 @@ def morphology_polydata(compartments, soma_compartment, color_fn, minRadius=0.0)
             radii.InsertNextTuple1(max(node['radius'], minRadius))
             types.InsertNextTuple1(node['type'])
 
-            color = color_fn(node)
+            color = node_color(color_fn, node)
             colors.InsertNextTuple3(color[0], color[1], color[2])
             compartment_ids.InsertNextTuple1(int(node['id']))
 
@@ -87,10 +95,6 @@ def morphology_polydata(compartments, soma_compartment, color_fn, minRadius=0.0)
                     lines.InsertCellPoint(i)
                 line = []
 
-    for p in xrange(1,points.GetNumberOfPoints()):
-        p1 = points.GetPoint(p-1)
-        p2 = points.GetPoint(p)
-
     # assuming we found a root, update its radius
     if soma_radius > 0 and soma_pid >= 0:
         radii.SetTuple1(soma_pid, soma_radius)
@@ -106,12 +110,116 @@ def morphology_polydata(compartments, soma_compartment, color_fn, minRadius=0.0)
 
     return polyData
 
-def generate_sphere(root, color):
+# per-node colors.  color_fn may be a dict of type -> rgb, looked up for all
+# nodes at once, or a callable taking a compartment dict, called per node.
+def compartment_colors(morphology, order, color_fn):
+    if isinstance(color_fn, dict):
+        lut = np.zeros((256, 3), dtype=np.uint8)
+        for t, color in color_fn.items():
+            lut[t] = color
+        return lut[morphology.types[order]]
+
+    return np.array([ color_fn(morphology.node(i)) for i in order ], dtype=np.uint8).reshape(-1,3)
+
+def node_color(color_fn, node):
+    if isinstance(color_fn, dict):
+        return color_fn[node['type']]
+    return color_fn(node)
+
+# morphology_polydata for a CompactMorphology.  point k of the output is node
+# order[k] of the preorder traversal, and a polyline ends at every leaf, so the
+# lines and attributes are all built as arrays and handed to vtk in bulk.
+# line_radius_range=(lo, hi) keeps only polylines whose largest radius is in
+# [lo, hi); the other points stay in the output but are not referenced.
+def compact_morphology_polydata(morphology, color_fn, minRadius=0.0, line_radius_range=None):
+    ns = vtk.util.numpy_support
+
+    roots = morphology.roots
+    if len(roots):
+        order = np.concatenate([ morphology.preorder(root) for root in roots ])
+    else:
+        order = np.zeros(0, dtype=np.int64)
+    n = order.size
+
+    pidmap = np.full(len(morphology), -1, dtype=np.int64)
+    pidmap[order] = np.arange(n)
+
+    parent_index = morphology.parent_index[order]
+    is_leaf = (np.diff(morphology.child_offsets) == 0)[order]
+
+    # a line starts at the first point and after every leaf, and reaches back
+    # to its first node's parent if it has one
+    line_starts = np.concatenate([ [0], np.nonzero(is_leaf[:-1])[0] + 1 ]) if n else np.zeros(0, dtype=np.int64)
+    line_ends = np.append(line_starts[1:], n)
+
+    if line_radius_range is not None and line_starts.size:
+        line_radius = np.maximum.reduceat(morphology.radius[order], line_starts)
+        keep = (line_radius >= line_radius_range[0]) & (line_radius < line_radius_range[1])
+        line_starts = line_starts[keep]
+        line_ends = line_ends[keep]
+
+    has_parent = (parent_index[line_starts] != -1).astype(np.int64)
+    line_counts = line_ends - line_starts
+    line_sizes = line_counts + has_parent
+
+    # legacy cell layout: ( size, [parent pid], pid, pid, ..., size, ... )
+    cell_starts = np.cumsum(line_sizes + 1) - (line_sizes + 1)
+    cells = np.empty(int(np.sum(line_sizes + 1)), dtype=vtkcells.ID_DTYPE)
+    cells[cell_starts] = line_sizes
+    with_parent = np.nonzero(has_parent)[0]
+    cells[cell_starts[with_parent] + 1] = pidmap[parent_index[line_starts[with_parent]]]
+
+    line_of_point = np.repeat(np.arange(line_starts.size), line_counts)
+    point_offsets = np.arange(line_of_point.size) - (np.cumsum(line_counts) - line_counts)[line_of_point]
+    point_slots = cell_starts[line_of_point] + 1 + has_parent[line_of_point] + point_offsets
+    cells[point_slots] = line_starts[line_of_point] + point_offsets
+
+    lines = vtk.vtkCellArray()
+    lines.SetCells(line_starts.size, ns.numpy_to_vtkIdTypeArray(cells, deep=True))
+
+    points = vtk.vtkPoints()
+    points.SetData(ns.numpy_to_vtk(morphology.xyz[order].astype(np.float32), deep=True))
+
+    radius_values = np.maximum(morphology.radius[order], minRadius)
+
+    # as in morphology_polydata, the soma takes the radius of one of its children
+    soma_index = morphology.root_index
+    if soma_index is not None and pidmap[soma_index] >= 0:
+        soma_children = np.nonzero(parent_index == soma_index)[0]
+        if soma_children.size:
+            soma_radius = morphology.radius[order[soma_children[-1]]]
+            if soma_radius > 0:
+                radius_values[pidmap[soma_index]] = soma_radius
+
+    radii = ns.numpy_to_vtk(radius_values, deep=True, array_type=vtk.VTK_DOUBLE)
+    radii.SetName("radius")
+
+    types = ns.numpy_to_vtk(morphology.types[order], deep=True, array_type=vtk.VTK_UNSIGNED_CHAR)
+    types.SetName("type")
+
+    colors = ns.numpy_to_vtk(compartment_colors(morphology, order, color_fn), deep=True, array_type=vtk.VTK_UNSIGNED_CHAR)
+    colors.SetName("colors")
+
+    compartment_ids = ns.numpy_to_vtk(morphology.ids[order].astype(np.uint32), deep=True, array_type=vtk.VTK_UNSIGNED_INT)
+    compartment_ids.SetName("compartment_id")
+
+    polyData = vtk.vtkPolyData()
+    polyData.SetPoints(points)
+    polyData.SetLines(lines)
+    polyData.GetPointData().AddArray(radii)
+    polyData.GetPointData().AddArray(types)
+    polyData.GetPointData().AddArray(colors)
+    polyData.GetPointData().AddArray(compartment_ids)
+    polyData.GetPointData().SetActiveScalars("radius")
+
+    return polyData
+
+def generate_sphere(root, color, theta_resolution=32, phi_resolution=16):
     s = vtk.vtkSphereSource()
     s.SetRadius(root['radius'])
     s.SetCenter(root['x'], root['y'], root['z'])
-    s.SetThetaResolution(32)
-    s.SetPhiResolution(16)
+    s.SetThetaResolution(theta_resolution)
+    s.SetPhiResolution(phi_resolution)
     s.Update()
 
     pd = s.GetOutput()
@@ -128,7 +236,7 @@ def generate_sphere(root, color):
 
 def generate_mesh(compartments, root_compartment, color_fn, sides=6, radius=None):
     tubepd = generate_tube(compartments, root_compartment, color_fn, sides=sides, radius=radius)
-    spherepd = generate_sphere(root_compartment, color_fn(root_compartment))
+    spherepd = generate_sphere(root_compartment, node_color(color_fn, root_compartment))
     
     f = vtk.vtkAppendPolyData()
     f.AddInputData(tubepd)
@@ -140,14 +248,21 @@ def generate_mesh(compartments, root_compartment, color_fn, sides=6, radius=None
     
 def generate_tube(compartments, root_compartment, color_fn, sides=6, radius=None):
     polyData = morphology_polydata(compartments, root_compartment, color_fn)
+    return tube_polydata(polyData, sides, radius)
 
+def clean_polydata(polyData):
     cleanFilter = vtk.vtkCleanPolyData()
     cleanFilter.SetInputData(polyData)
+    cleanFilter.Update()
+
+    return cleanFilter.GetOutput()
 
+# tubes around polylines that have already been cleaned
+def tube_lines(polyData, sides=6, radius=None):
     tubeFilter = vtk.vtkTubeFilter()
     tubeFilter.SetNumberOfSides(sides)
     tubeFilter.SidesShareVerticesOn()
-    tubeFilter.SetInputConnection(cleanFilter.GetOutputPort())
+    tubeFilter.SetInputData(polyData)
     if radius is None:
         tubeFilter.SetVaryRadiusToVaryRadiusByAbsoluteScalar()
     else:
@@ -157,41 +272,119 @@ def generate_tube(compartments, root_compartment, color_fn, sides=6, radius=None
 
     return tubeFilter.GetOutput()
 
+def tube_polydata(polyData, sides=6, radius=None):
+    return tube_lines(clean_polydata(polyData), sides, radius)
+
+# level of detail settings for generate_lod_mesh, finest first.  polylines
+# thinner than the thin_quantile radius of the cell get thin_sides, compartments
+# within tolerance * radius of the segment around them are merged, and the
+# soma sphere is tessellated with soma_resolution (theta, phi).
+LOD_LEVELS = [
+    dict(sides=6, thin_sides=6, thin_quantile=0.5, tolerance=0.0, soma_resolution=(32, 16)),
+    dict(sides=6, thin_sides=4, thin_quantile=0.5, tolerance=0.1, soma_resolution=(16, 8)),
+    dict(sides=4, thin_sides=3, thin_quantile=0.5, tolerance=0.5, soma_resolution=(8, 6))
+]
+
+def generate_lod_mesh(morphology, color_fn, sides=6, thin_sides=6, thin_quantile=0.5,
+                      tolerance=0.0, soma_resolution=(32, 16)):
+    if tolerance > 0:
+        morphology = morphology.decimate(tolerance)
+
+    root = morphology.root
+
+    if thin_sides == sides:
+        tubes = [ tube_polydata(compact_morphology_polydata(morphology, color_fn), sides) ]
+    else:
+        thin_radius = np.percentile(morphology.radius, 100.0 * thin_quantile)
+        thick_pd = compact_morphology_polydata(morphology, color_fn, line_radius_range=(thin_radius, np.inf))
+        thin_pd = compact_morphology_polydata(morphology, color_fn, line_radius_range=(-np.inf, thin_radius))
+        tubes = [ tube_polydata(thick_pd, sides), tube_polydata(thin_pd, thin_sides) ]
+
+    f = vtk.vtkAppendPolyData()
+    for tube in tubes:
+        f.AddInputData(tube)
+    f.AddInputData(generate_sphere(root, node_color(color_fn, root), *soma_resolution))
+    f.Update()
+
+    return f.GetOutput()
+
+# one mesh per level in levels
+def generate_lod_meshes(morphology, color_fn, levels=LOD_LEVELS):
+    return [ generate_lod_mesh(morphology, color_fn, **level) for level in levels ]
+
+# offsets (K+1) and point ids of the cells in a vtkCellArray, so cell k is
+# connectivity[offsets[k]:offsets[k+1]]
+def cell_array_to_numpy(cells):
+    ns = vtk.util.numpy_support
+
+    if hasattr(cells, 'GetOffsetsArray'):
+        offsets = ns.vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64)
+        connectivity = ns.vtk_to_numpy(cells.GetConnectivityArray())
+        return offsets, connectivity
+
+    # legacy layout ( n, p1, p2, ..., n, p1, p2, ... ): only the headers need
+    # walking, the rest is sliced out in one go
+    legacy = ns.vtk_to_numpy(cells.GetData())
+    values = legacy.tolist()
+
+    headers = []
+    h = 0
+    while h < len(values):
+        headers.append(h)
+        h += values[h] + 1
+    headers = np.array(headers, dtype=np.int64)
+
+    is_header = np.zeros(legacy.size, dtype=bool)
+    is_header[headers] = True
+
+    sizes = legacy[headers].astype(np.int64)
+    offsets = np.zeros(sizes.size + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+
+    return offsets, legacy[~is_header]
+
+# join strips into one strip, repeating the last point of each strip and the
+# first point of the next so the triangles in between are degenerate
+def stitch_strips(connectivity, starts, sizes):
+    if starts.size == 0:
+        return np.zeros(0, dtype=np.uint32)
+
+    bridge = np.full(starts.size, 2, dtype=np.int64)
+    bridge[0] = 0
+    lengths = sizes + bridge
+
+    strip_of = np.repeat(np.arange(starts.size), lengths)
+    pos = np.arange(strip_of.size) - (np.cumsum(lengths) - lengths)[strip_of]
+
+    index = starts[strip_of] + pos - bridge[strip_of]
+
+    # the two bridge points of strip k are the end of strip k-1 and the start of strip k
+    ends = starts + sizes - 1
+    first_bridge = np.nonzero((pos == 0) & (bridge[strip_of] == 2))[0]
+    index[first_bridge] = ends[strip_of[first_bridge] - 1]
+    index[first_bridge + 1] = starts[strip_of[first_bridge]]
+
+    return connectivity[index].astype(np.uint32)
+
 # breaking down all of the strips in a vtk tube by type
 def tube_to_numpy(pd):
-    strips = vtk.util.numpy_support.vtk_to_numpy(pd.GetStrips().GetData())
-
-    strips_by_type = {}
+    offsets, connectivity = cell_array_to_numpy(pd.GetStrips())
 
     types = vtk.util.numpy_support.vtk_to_numpy(pd.GetPointData().GetScalars("type"))
     points = vtk.util.numpy_support.vtk_to_numpy(pd.GetPoints().GetData())
     compartment_ids = vtk.util.numpy_support.vtk_to_numpy(pd.GetPointData().GetScalars("compartment_id"))
     normals = vtk.util.numpy_support.vtk_to_numpy(pd.GetPointData().GetNormals())
 
-    def append_substrip(ptype, strip):
-        if ptype not in strips_by_type:
-           strips_by_type[ptype] = np.array(strip, dtype=np.uint32)
-        else:
-            type_strip = strips_by_type[ptype] 
-            type_strip = np.append(type_strip, [type_strip[-1], strip[0]])
-            strips_by_type[ptype] = np.append(type_strip, strip)
-
-    # loop through each triangle strip ( n, p1, p2, p3, ..., n, p1, p2, p3, ... )
-    offset = 0
-    while offset < strips.size:
-        npts = strips[offset]
-        offset += 1
-        
-        strip = strips[offset:offset+npts]
-        # classify each strip by the type of its last point
-        strip_type = types[strip[-1]]
+    starts = offsets[:-1]
+    sizes = np.diff(offsets)
 
-        append_substrip(strip_type, strip)
+    # classify each strip by the type of its last point
+    strip_types = types[connectivity[offsets[1:] - 1]] if sizes.size else np.zeros(0, dtype=types.dtype)
 
-        offset += npts
-
-    for k,v in strips_by_type.iteritems():
-        strips_by_type[k] = v.astype(np.uint32)
+    strips_by_type = {}
+    for strip_type in np.unique(strip_types):
+        selected = np.nonzero(strip_types == strip_type)[0]
+        strips_by_type[strip_type] = stitch_strips(connectivity, starts[selected], sizes[selected])
 
     return {
         "points": points,
@@ -201,22 +394,61 @@ def tube_to_numpy(pd):
         "types": types
     }
 
+# write the tube_to_numpy buffers as raw little-endian files plus a json
+# manifest describing them, for loading into a web viewer
+def write_tube_buffers(tube, directory):
+    import json
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    buffers = {
+        "points": tube["points"].astype('<f4'),
+        "normals": tube["normals"].astype('<f4'),
+        "compartment_ids": tube["compartment_ids"].astype('<u4'),
+        "types": tube["types"].astype('u1')
+        }
+    for strip_type, strip in tube["strips"].items():
+        buffers["strips_%d" % strip_type] = strip.astype('<u4')
+
+    manifest = {}
+    for name, values in buffers.items():
+        file_name = name + ".bin"
+        values.tofile(os.path.join(directory, file_name))
+        manifest[name] = { "file": file_name,
+                           "dtype": values.dtype.str,
+                           "shape": list(values.shape) }
+
+    with open(os.path.join(directory, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
 def write_vtk(pd, filename):
     w = vtk.vtkPolyDataWriter()
     w.SetFileName(filename)
     w.SetInputData(pd)
     w.Update()        
 
-def write_ply(pd, filename):
+def triangle_polydata(pd):
     f = vtk.vtkTriangleFilter()
     f.SetInputData(pd)
     f.Update()
-    
+
+    return f.GetOutput()
+
+# write polydata that is already all triangles
+def write_triangle_ply(pd, filename, binary=True):
     w = vtk.vtkPLYWriter()
     w.SetFileName(filename)
-    w.SetInputData(f.GetOutput())
+    w.SetInputData(pd)
     w.SetArrayName("colors")
-    w.SetFileTypeToASCII()
-    w.Update()        
+    if binary:
+        w.SetFileTypeToBinary()
+        w.SetDataByteOrderToLittleEndian()
+    else:
+        w.SetFileTypeToASCII()
+    w.Update()
 
-    
+def write_ply(pd, filename, binary=True):
+    write_triangle_ply(triangle_polydata(pd), filename, binary)
@@ -38,3 +38,15 @@ def rotate3z(rads):
                      [ -sth, cth, 0, 0],
                      [ 0, 0, 1, 0],
                      [ 0, 0, 0, 1 ]])
+
+# compose transforms right to left, so compose(a, b, c) applies c first
+def compose(*transforms):
+    m = np.eye(4)
+    for t in transforms:
+        m = np.dot(m, t)
+    return m
+
+# apply a 4x4 affine transform to an (N,3) array of points
+def transform_points(transform, points):
+    transform = np.asarray(transform, dtype=np.float64)
+    return np.dot(points, transform[:3,:3].T) + transform[:3,3]
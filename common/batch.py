@@ -0,0 +1,67 @@
+import time
+import traceback
+import multiprocessing
+
+# a task is ( fn, args, fields ).  the result is fields updated with the dict
+# fn(*args) returns, plus 'error' (a traceback or None) and 'seconds'.
+
+# pool worker: never raises, so one bad task can't take down the batch
+def run_task(task):
+    fn, args, fields = task
+
+    start = time.time()
+    result = dict(fields, error=None)
+    try:
+        result.update(fn(*args))
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.time() - start
+
+    return result
+
+# run tasks on workers processes, printing a line per task as it finishes.
+# describe(result) names the task in those lines.  fn has to be a module
+# level function so the pool can pickle it.
+def run_tasks(tasks, workers=1, describe=str, show_errors=False):
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        results_iter = pool.imap_unordered(run_task, tasks)
+    else:
+        pool = None
+        results_iter = (run_task(task) for task in tasks)
+
+    results = []
+    try:
+        for result in results_iter:
+            results.append(result)
+            if result['error'] is None:
+                print("[%d/%d] %s (%.1fs)" % (len(results), len(tasks), describe(result), result['seconds']))
+            else:
+                print("[%d/%d] %s failed (%.1fs)" % (len(results), len(tasks), describe(result), result['seconds']))
+                if show_errors:
+                    print(result['error'])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return results
+
+# counts and timings of a finished batch.  worker seconds are the tasks'
+# wall times added up, which is more than the batch's wall time when they
+# ran in parallel.
+def summarize(results, wall_seconds, noun):
+    seconds = [ r['seconds'] for r in results ]
+    failed = len([ r for r in results if r['error'] is not None ])
+
+    return { noun: len(results),
+             'succeeded': len(results) - failed,
+             'failed': failed,
+             'wall_seconds': wall_seconds,
+             'worker_seconds_total': sum(seconds),
+             'worker_seconds_max': max(seconds) if seconds else 0.0 }
+
+def print_summary(summary, noun):
+    print("%d %s, %d failed, %.1fs wall, %.1fs summed over workers" % (summary[noun], noun, summary['failed'],
+                                                                       summary['wall_seconds'],
+                                                                       summary['worker_seconds_total']))
@@ -0,0 +1,486 @@
+import copy
+import math
+import numpy as np
+
+import turntable
+import renderpresets
+import renderjobs
+
+# scenes are described by plain dicts so they can be built, compared and
+# hashed without blender, then applied to the current blender scene in one
+# pass by apply_scene:
+#
+#   world:   render engine, resolution, transparency and ambient occlusion
+#   render:  cycles samples, light paths, tiles, threads and denoising, see
+#            renderpresets
+#   tracker: empty that the camera and the lights point at
+#   camera:  ORTHO or PERSP, where it sits, and either a circular path to
+#            follow or a turntable of keyframed poses
+#   lights:  list of lamps
+#   meshes:  list of plys and their materials
+#   output:  render.filepath, and the frame range for animations
+#
+# bpy is only imported by the functions that touch blender.
+
+WORLD_DEFAULTS = {
+    'engine': 'CYCLES',
+    'resolution_x': 5940,
+    'resolution_y': 3600,
+    'resolution_percentage': 100,
+    'transparent_background': True,
+    'ambient_occlusion': 0.4,     # ao factor, None turns it off
+    'horizon_color': (0, 0, 0),
+    'persistent_data': False
+}
+
+LIGHT_DEFAULTS = {
+    'type': 'AREA',
+    'location': (10, -5, 10),
+    'strength': 5000,
+    'track': True
+}
+
+MESH_DEFAULTS = {
+    'vertex_colors': True,
+    'material': 'diffuse'
+}
+
+# radius of the camera path around the tracker
+PATH_RADIUS = 10.0
+
+# a copy of defaults updated with settings
+def with_defaults(defaults, settings):
+    values = copy.deepcopy(defaults)
+    values.update(settings or {})
+    return values
+
+def world_settings(**settings):
+    return with_defaults(WORLD_DEFAULTS, settings)
+
+def light(**settings):
+    return with_defaults(LIGHT_DEFAULTS, settings)
+
+def mesh(ply, **settings):
+    return with_defaults(MESH_DEFAULTS, dict(settings, ply=ply))
+
+SPIN_MODES = ( 'path', 'keyframes', 'object' )
+
+# the camera circles the mesh over num_frames frames, always pointing at the
+# tracker at height z and raised by elevation degrees.  spin is 'path' to
+# follow a circle with constraints, 'keyframes' to key an exact pose on every
+# frame, which also allows several revolutions, or 'object' to hold the
+# camera and lights still and turn the mesh instead.  only the mesh's
+# transform changes between frames then, so cycles keeps its data (and the
+# mesh's bvh) from one frame to the next.
+def turntable_scene(ply, outdir, scale, z, num_frames, material='diffuse', lights=None, world=None,
+                    frame_start=1, frame_end=None, spin='path', radius=PATH_RADIUS, elevation=0.0, revolutions=1.0,
+                    render=None):
+    camera = { 'type': 'ORTHO',
+               'ortho_scale': scale,
+               'location': (0, 0, 0) }
+
+    if spin == 'path':
+        if revolutions != 1:
+            raise ValueError("a path turntable makes one revolution, use spin='keyframes'")
+        el = math.radians(elevation)
+        camera['path'] = { 'location': (0, 0, z + radius * math.sin(el)),
+                           'radius': radius * math.cos(el),
+                           'duration': num_frames }
+    elif spin == 'keyframes':
+        camera['turntable'] = { 'target': (0, 0, z),
+                                'radius': radius,
+                                'elevation': elevation,
+                                'revolutions': revolutions,
+                                'duration': num_frames }
+    elif spin == 'object':
+        locations, rotations = turntable.camera_poses(1, radius, math.radians(elevation), target=(0, 0, z))
+        camera['location'] = tuple(locations[0])
+        camera['rotation_euler'] = tuple(rotations[0])
+    else:
+        raise ValueError("unknown spin '%s', expected one of %s" % (spin, SPIN_MODES))
+
+    meshes = [ mesh(ply, material=material) ]
+    world = world_settings(**(world or {}))
+    if spin == 'object':
+        world['persistent_data'] = True
+        for m in meshes:
+            m['turntable'] = { 'target': (0, 0, z),
+                               'revolutions': revolutions,
+                               'duration': num_frames }
+
+    return {
+        'world': world,
+        'render': render or renderpresets.render_profile(),
+        'tracker': { 'location': (0, 0, z) },
+        'camera': camera,
+        'lights': lights if lights is not None else [ light() ],
+        'meshes': meshes,
+        'output': { 'filepath': outdir,
+                    'animation': True,
+                    'frame_start': frame_start,
+                    'frame_end': num_frames if frame_end is None else frame_end }
+    }
+
+# the turntable scene for a renderjobs job.  the lights, and the material of
+# jobs that don't name one, are up to the calling script.
+def job_scene(job, lights=None, material='diffuse'):
+    world = { 'resolution_x': job['resolution_x'],
+              'resolution_y': job['resolution_y'],
+              'resolution_percentage': job['resolution'] }
+    return turntable_scene(job['ply'], job['outdir'], job['scale'], job['z'], job['steps'],
+                           material=job['material'] or material, lights=lights, world=world,
+                           frame_start=job['frame_start'], frame_end=job['frame_end'],
+                           spin=job['spin'], radius=job['radius'],
+                           elevation=job['elevation'], revolutions=job['revolutions'],
+                           render=renderpresets.render_profile(job['preset'], job['render_settings']))
+
+# remove everything from the startup scene, or from the previous job
+def reset_blend():
+    import bpy
+
+    for scene in bpy.data.scenes:
+        for obj in scene.objects:
+            scene.objects.unlink(obj)
+
+    for bpy_data_iter in (
+            bpy.data.objects,
+            bpy.data.meshes,
+            bpy.data.lamps,
+            bpy.data.cameras,
+            bpy.data.curves,
+            bpy.data.materials,
+            bpy.data.actions
+            ):
+        for id_data in bpy_data_iter:
+            bpy_data_iter.remove(id_data, do_unlink=True)
+
+def setup_world(world):
+    import bpy
+
+    scene = bpy.context.scene
+    scene.render.engine = world['engine']
+    scene.render.resolution_x = world['resolution_x']
+    scene.render.resolution_y = world['resolution_y']
+    scene.render.resolution_percentage = world['resolution_percentage']
+    scene.cycles.film_transparent = world['transparent_background']
+    scene.render.use_persistent_data = world['persistent_data']
+
+    blender_world = bpy.data.worlds['World']
+    blender_world.light_settings.use_ambient_occlusion = world['ambient_occlusion'] is not None
+    if world['ambient_occlusion'] is not None:
+        blender_world.light_settings.ao_factor = world['ambient_occlusion']
+    blender_world.horizon_color = world['horizon_color']
+
+CYCLES_SETTINGS = ( 'samples', 'max_bounces', 'diffuse_bounces', 'glossy_bounces', 'transmission_bounces',
+                    'transparent_max_bounces' )
+
+# the current render settings as a profile
+def render_settings():
+    import bpy
+
+    scene = bpy.context.scene
+    profile = { k: getattr(scene.cycles, k) for k in CYCLES_SETTINGS }
+    profile['tile_size'] = scene.render.tile_x
+    profile['threads'] = scene.render.threads if scene.render.threads_mode == 'FIXED' else 0
+    profile['denoise'] = any(layer.cycles.use_denoising for layer in scene.render.layers)
+    return profile
+
+# blender's settings from before the first profile was applied, so a job
+# without a preset gets them back rather than the previous job's
+_blender_render_settings = None
+
+# apply a render profile (see renderpresets).  settings the profile leaves out
+# are blender's own.
+def setup_render(profile):
+    import bpy
+    global _blender_render_settings
+
+    if _blender_render_settings is None:
+        _blender_render_settings = render_settings()
+    profile = dict(_blender_render_settings, **profile)
+
+    scene = bpy.context.scene
+    for k in CYCLES_SETTINGS:
+        setattr(scene.cycles, k, profile[k])
+
+    scene.render.tile_x = profile['tile_size']
+    scene.render.tile_y = profile['tile_size']
+
+    if profile['threads'] > 0:
+        scene.render.threads_mode = 'FIXED'
+        scene.render.threads = profile['threads']
+    else:
+        scene.render.threads_mode = 'AUTO'
+
+    # denoising is a render layer setting
+    for layer in scene.render.layers:
+        layer.cycles.use_denoising = profile['denoise']
+
+# material is 'diffuse', 'glass', or 'glass_ao' (glass mixed with a little
+# ambient occlusion), all colored by the ply's vertex colors
+def add_material(obj, material='diffuse', vertex_colors=True):
+    import bpy
+
+    mat = bpy.data.materials.new("Material")
+    mat.use_nodes = True
+
+    if vertex_colors:
+        nodes = mat.node_tree.nodes
+        links = mat.node_tree.links
+
+        att = nodes.new('ShaderNodeAttribute')
+        att.attribute_name = 'Col'
+
+        if material in ('glass', 'glass_ao'):
+            nodes.remove(nodes.get('Diffuse BSDF'))
+
+            glass = nodes.new('ShaderNodeBsdfGlass')
+            glass.inputs['Roughness'].default_value = 0.217
+            glass.inputs['IOR'].default_value = 2.1
+            links.new(att.outputs['Color'], glass.inputs['Color'])
+
+            shader = glass
+            if material == 'glass_ao':
+                ao = nodes.new('ShaderNodeAmbientOcclusion')
+                links.new(att.outputs['Color'], ao.inputs['Color'])
+
+                shader = nodes.new('ShaderNodeMixShader')
+                shader.inputs['Fac'].default_value = .02
+                links.new(glass.outputs[0], shader.inputs[1])
+                links.new(ao.outputs[0], shader.inputs[2])
+
+            material_output = nodes.get('Material Output')
+            links.new(shader.outputs[0], material_output.inputs[0])
+        elif material == 'diffuse':
+            diff = nodes.get('Diffuse BSDF')
+            links.new(att.outputs['Color'], diff.inputs['Color'])
+        else:
+            raise ValueError("unknown material '%s'" % material)
+
+    obj.data.materials.append(mat)
+    return mat
+
+# smooth shading is set on the polygons directly instead of with the
+# shade_smooth operator
+def add_ply(mesh_settings):
+    import bpy
+
+    bpy.ops.import_mesh.ply(filepath=mesh_settings['ply'])
+    obj = bpy.context.scene.objects.active
+    obj.location = (0,0,0)
+
+    polygons = obj.data.polygons
+    polygons.foreach_set('use_smooth', [ True ] * len(polygons))
+
+    add_material(obj, mesh_settings['material'], mesh_settings['vertex_colors'])
+    return obj
+
+# new object linked into the current scene
+def link_object(name, object_data):
+    import bpy
+
+    obj = bpy.data.objects.new(name, object_data)
+    bpy.context.scene.objects.link(obj)
+    return obj
+
+# an empty for the camera and lights to point at
+def add_tracker(tracker):
+    obj = link_object('Tracker', None)
+    obj.empty_draw_type = 'CUBE'
+    obj.empty_draw_size = .1
+    obj.location = tracker['location']
+    return obj
+
+def add_camera(camera_settings):
+    import bpy
+
+    cam = bpy.data.cameras.new('Camera')
+    cam.type = camera_settings['type']
+    if 'ortho_scale' in camera_settings:
+        cam.ortho_scale = camera_settings['ortho_scale']
+    if 'lens' in camera_settings:
+        cam.lens = camera_settings['lens']
+
+    camera = link_object('Camera', cam)
+    camera.location = camera_settings['location']
+    if 'rotation_euler' in camera_settings:
+        camera.rotation_euler = camera_settings['rotation_euler']
+
+    bpy.context.scene.camera = camera
+    return camera
+
+# the same four point circle as primitive_bezier_circle_add
+CIRCLE_POINTS = ( (-1, 0, 0), (0, 1, 0), (1, 0, 0), (0, -1, 0) )
+
+# a circle of the given radius that the camera follows once over duration
+# frames, starting at frame 1
+def add_camera_path(camera, path):
+    import bpy
+
+    curve = bpy.data.curves.new('Path', 'CURVE')
+    curve.dimensions = '3D'
+    curve.path_duration = path['duration']
+
+    spline = curve.splines.new('BEZIER')
+    spline.bezier_points.add(len(CIRCLE_POINTS) - 1)
+    for point, co in zip(spline.bezier_points, CIRCLE_POINTS):
+        point.co = co
+        point.handle_left_type = 'AUTO'
+        point.handle_right_type = 'AUTO'
+    spline.use_cyclic_u = True
+
+    circle = link_object('Path', curve)
+    circle.location = path['location']
+    circle.scale = (path['radius'],) * 3
+
+    # what followpath_path_animate does: eval_time runs 0 to duration
+    # linearly from frame 1 to frame duration + 1
+    for frame, eval_time in ((1, 0), (path['duration'] + 1, path['duration'])):
+        curve.eval_time = eval_time
+        curve.keyframe_insert('eval_time', frame=frame)
+    for fcurve in curve.animation_data.action.fcurves:
+        for k in fcurve.keyframe_points:
+            k.interpolation = 'LINEAR'
+
+    constraint = camera.constraints.new('FOLLOW_PATH')
+    constraint.target = circle
+
+    return circle
+
+# key values (N,k) of a vector property on frames (N,), one fcurve per
+# component, without going through keyframe_insert.  indices picks the
+# components the k columns are, by default the first k.
+def set_keyframes(id_data, data_path, frames, values, indices=None):
+    import bpy
+
+    anim = id_data.animation_data_create()
+    if anim.action is None:
+        anim.action = bpy.data.actions.new(id_data.name + "Action")
+
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(frames), -1)
+    if indices is None:
+        indices = range(values.shape[1])
+    for i, index in enumerate(indices):
+        fcurve = anim.action.fcurves.new(data_path, index=index)
+        fcurve.keyframe_points.add(len(frames))
+        fcurve.keyframe_points.foreach_set('co', np.column_stack([ frames, values[:,i] ]).ravel().tolist())
+        fcurve.update()
+
+# key the camera's location and rotation on every frame of the turntable, so
+# nothing is left for constraints to solve per frame
+def add_camera_keyframes(camera, settings):
+    frames = np.arange(1, settings['duration'] + 1)
+    locations, rotations = turntable.camera_poses(settings['duration'], settings['radius'],
+                                                  math.radians(settings['elevation']), settings['revolutions'],
+                                                  settings['target'])
+    set_keyframes(camera, 'location', frames, locations)
+    set_keyframes(camera, 'rotation_euler', frames, rotations)
+
+# key the mesh's turn about the vertical axis through the target on every
+# frame.  plys are imported at the origin, so only the z rotation changes
+# unless the target is off the z axis.
+def add_object_keyframes(obj, settings):
+    frames = np.arange(1, settings['duration'] + 1)
+    rotations, locations = turntable.object_transforms(settings['duration'], settings['revolutions'],
+                                                       settings['target'], tuple(obj.location))
+    set_keyframes(obj, 'rotation_euler', frames, rotations[:,2:], indices=[ 2 ])
+    if np.ptp(locations, axis=0).max() > 0:
+        set_keyframes(obj, 'location', frames, locations)
+
+def add_light(light_settings):
+    import bpy
+
+    lamp = bpy.data.lamps.new(light_settings['type'].capitalize(), light_settings['type'])
+    lamp.use_nodes = True
+    for k in ('shape', 'size', 'size_y', 'shadow_soft_size'):
+        if k in light_settings:
+            setattr(lamp, k, light_settings[k])
+    lamp.node_tree.nodes['Emission'].inputs['Strength'].default_value = light_settings['strength']
+
+    obj = link_object(lamp.name, lamp)
+    obj.location = light_settings['location']
+    return obj
+
+# the constraint track_set(type='TRACKTO') adds
+def track_to(obj, tracker):
+    constraint = obj.constraints.new('TRACK_TO')
+    constraint.target = tracker
+    constraint.track_axis = 'TRACK_NEGATIVE_Z'
+    constraint.up_axis = 'UP_Y'
+    return constraint
+
+# build the described scene from scratch with the data api, which needs no
+# context or selection and works the same in --background.  only the ply
+# import is an operator.  returns the objects it made.
+def apply_scene(description):
+    import bpy
+
+    reset_blend()
+    setup_world(description['world'])
+    setup_render(description['render'])
+
+    meshes = []
+    for mesh_settings in description['meshes']:
+        meshes.append(add_ply(mesh_settings))
+        if mesh_settings.get('turntable'):
+            add_object_keyframes(meshes[-1], mesh_settings['turntable'])
+
+    tracker = add_tracker(description['tracker'])
+    camera = add_camera(description['camera'])
+
+    path = None
+    if description['camera'].get('turntable'):
+        add_camera_keyframes(camera, description['camera']['turntable'])
+    elif 'rotation_euler' not in description['camera']:
+        if description['camera'].get('path'):
+            path = add_camera_path(camera, description['camera']['path'])
+        track_to(camera, tracker)
+
+    lights = []
+    for light_settings in description['lights']:
+        lights.append(add_light(light_settings))
+        if light_settings['track']:
+            track_to(lights[-1], tracker)
+
+    output = description['output']
+    scene = bpy.context.scene
+    scene.render.filepath = output['filepath']
+    if output['animation']:
+        scene.frame_start = output['frame_start']
+        scene.frame_end = output['frame_end']
+
+    return { 'meshes': meshes, 'tracker': tracker, 'camera': camera, 'path': path, 'lights': lights }
+
+# render the scene applied last.  frame_ranges is a list of (first, last) runs
+# of an animation to render, by default its whole frame range.
+def render_scene(description, frame_ranges=None, dry_run=False):
+    import bpy
+
+    output = description['output']
+    scene = bpy.context.scene
+
+    if not output['animation']:
+        if not dry_run:
+            bpy.ops.render.render(write_still=True)
+        return
+
+    if frame_ranges is None:
+        frame_ranges = [ (output['frame_start'], output['frame_end']) ]
+
+    for first, last in frame_ranges:
+        scene.frame_start = first
+        scene.frame_end = last
+        if not dry_run:
+            bpy.ops.render.render(animation=True)
+
+# set up and render a job's scene.  with job['resume'] on, only the missing or
+# unfinished frames are rendered.
+def render_job(job, lights=None, material='diffuse', dry_run=False):
+    frame_ranges = renderjobs.render_ranges(job)
+    if not frame_ranges:
+        return
+
+    scene = job_scene(job, lights, material)
+    apply_scene(scene)
+    render_scene(scene, frame_ranges, dry_run=dry_run)
@@ -0,0 +1,840 @@
+import os
+import sys
+import time
+import argparse
+
+# a stand-in for the parts of blender's bpy module (2.7x api) that the render
+# scripts use, so scene construction can be run and timed without blender.
+#
+#   import fakebpy
+#   fakebpy.install()        # import bpy now returns this module
+#   ...build a scene...
+#   fakebpy.stats            # operator calls, depsgraph updates, renders
+#
+# operators behave like blender's: they act on the selection and the active
+# object and every call counts as a depsgraph update.  data api calls only
+# change data.  unknown operators, node types, sockets and settings raise.
+
+class Settings(object):
+    # fields maps attribute name -> default; anything else is an error
+    def __init__(self, **fields):
+        object.__setattr__(self, '_fields', dict(fields))
+
+    def __getattr__(self, name):
+        fields = object.__getattribute__(self, '_fields')
+        if name not in fields:
+            raise AttributeError("'%s' has no attribute '%s'" % (type(self).__name__, name))
+        return fields[name]
+
+    def __setattr__(self, name, value):
+        if name not in self._fields:
+            raise AttributeError("'%s' has no attribute '%s'" % (type(self).__name__, name))
+        self._fields[name] = value
+
+class RenderSettings(Settings):
+    def __init__(self):
+        Settings.__init__(self,
+                          engine='BLENDER_RENDER',
+                          resolution_x=1920,
+                          resolution_y=1080,
+                          resolution_percentage=50,
+                          filepath='/tmp/',
+                          tile_x=64,
+                          tile_y=64,
+                          threads_mode='AUTO',
+                          threads=1,
+                          use_persistent_data=False,
+                          layers=[ RenderLayer('RenderLayer') ])
+
+class CyclesSettings(Settings):
+    def __init__(self):
+        Settings.__init__(self,
+                          film_transparent=False,
+                          samples=128,
+                          preview_samples=32,
+                          max_bounces=12,
+                          min_bounces=3,
+                          diffuse_bounces=4,
+                          glossy_bounces=4,
+                          transmission_bounces=12,
+                          volume_bounces=0,
+                          transparent_max_bounces=8,
+                          transparent_min_bounces=8)
+
+# 2.79 keeps denoising on the render layers
+class LayerCyclesSettings(Settings):
+    def __init__(self):
+        Settings.__init__(self, use_denoising=False)
+
+class RenderLayer(object):
+    def __init__(self, name):
+        self.name = name
+        self.cycles = LayerCyclesSettings()
+
+class LightSettings(Settings):
+    def __init__(self):
+        Settings.__init__(self,
+                          use_ambient_occlusion=False,
+                          ao_factor=1.0)
+
+# named collection of datablocks, like bpy.data.objects
+class Collection(object):
+    def __init__(self, factory=None):
+        self.items = []
+        self.factory = factory
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.items[key]
+        item = self.get(key)
+        if item is None:
+            raise KeyError("bpy_prop_collection[key]: key \"%s\" not found" % key)
+        return item
+
+    def get(self, name, default=None):
+        for item in self.items:
+            if item.name == name:
+                return item
+        return default
+
+    def unique_name(self, name):
+        if name not in self:
+            return name
+        i = 1
+        while "%s.%03d" % (name, i) in self:
+            i += 1
+        return "%s.%03d" % (name, i)
+
+    def add(self, item):
+        item.name = self.unique_name(item.name)
+        self.items.append(item)
+        return item
+
+    def new(self, name, *args, **kwargs):
+        return self.add(self.factory(name, *args, **kwargs))
+
+    def remove(self, item, do_unlink=False):
+        if item not in self.items:
+            raise ReferenceError("%s is not in this collection" % item.name)
+        if getattr(item, 'users', 0) > 0 and not do_unlink:
+            raise RuntimeError("Error: %s must have zero users to be removed, found %d" % (item.name, item.users))
+        if do_unlink and isinstance(item, Object):
+            for scene in data.scenes:
+                if item in scene.objects.items:
+                    scene.objects.unlink(item)
+        if isinstance(item, Object) and item.data is not None:
+            item.data.users -= 1
+        self.items.remove(item)
+
+class Keyframe(object):
+    def __init__(self, frame=0.0, value=0.0):
+        self.co = (frame, value)
+        self.interpolation = 'BEZIER'
+
+class KeyframePoints(object):
+    def __init__(self):
+        self.items = []
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        return self.items[i]
+
+    def add(self, count=1):
+        self.items.extend(Keyframe() for _ in range(count))
+
+    def insert(self, frame, value):
+        self.items = [ k for k in self.items if k.co[0] != frame ]
+        self.items.append(Keyframe(frame, value))
+        self.items.sort(key=lambda k: k.co[0])
+        return self.items[-1]
+
+    # co is a flat sequence of frame, value pairs
+    def foreach_set(self, attr, values):
+        if attr != 'co':
+            raise AttributeError("foreach_set: unsupported attribute '%s'" % attr)
+        values = [ float(v) for v in values ]
+        if len(values) != 2 * len(self.items):
+            raise RuntimeError("foreach_set: array length mismatch")
+        for i, k in enumerate(self.items):
+            k.co = (values[2*i], values[2*i+1])
+
+class FCurve(object):
+    def __init__(self, data_path, array_index):
+        self.data_path = data_path
+        self.array_index = array_index
+        self.keyframe_points = KeyframePoints()
+        self.extrapolation = 'CONSTANT'
+
+    def update(self):
+        self.keyframe_points.items.sort(key=lambda k: k.co[0])
+
+    # bezier keys are evaluated as linear, the fake has no handles
+    def evaluate(self, frame):
+        keys = self.keyframe_points.items
+        if not keys:
+            raise RuntimeError("fcurve %s[%d] has no keyframes" % (self.data_path, self.array_index))
+
+        if frame <= keys[0].co[0] or frame >= keys[-1].co[0]:
+            k0, k1 = (keys[0], keys[1 % len(keys)]) if frame <= keys[0].co[0] else (keys[-2 % len(keys)], keys[-1])
+            end = keys[0] if frame <= keys[0].co[0] else keys[-1]
+            if self.extrapolation == 'LINEAR' and k1.co[0] != k0.co[0]:
+                slope = (k1.co[1] - k0.co[1]) / float(k1.co[0] - k0.co[0])
+                return end.co[1] + slope * (frame - end.co[0])
+            return end.co[1]
+
+        for k0, k1 in zip(keys[:-1], keys[1:]):
+            if k0.co[0] <= frame <= k1.co[0]:
+                if k0.interpolation == 'CONSTANT':
+                    return k0.co[1] if frame < k1.co[0] else k1.co[1]
+                t = (frame - k0.co[0]) / float(k1.co[0] - k0.co[0])
+                return k0.co[1] + t * (k1.co[1] - k0.co[1])
+
+class FCurves(object):
+    def __init__(self):
+        self.items = []
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def find(self, data_path, index=0):
+        for fcurve in self.items:
+            if fcurve.data_path == data_path and fcurve.array_index == index:
+                return fcurve
+        return None
+
+    def new(self, data_path, index=0, action_group=''):
+        if self.find(data_path, index) is not None:
+            raise RuntimeError("Error: F-Curve '%s[%d]' already exists in action" % (data_path, index))
+        fcurve = FCurve(data_path, index)
+        self.items.append(fcurve)
+        return fcurve
+
+class AnimData(object):
+    def __init__(self):
+        self._action = None
+
+    @property
+    def action(self):
+        return self._action
+
+    @action.setter
+    def action(self, action):
+        if self._action is not None:
+            self._action.users -= 1
+        self._action = action
+        if action is not None:
+            action.users += 1
+
+class ID(object):
+    def __init__(self, name):
+        self.name = name
+        self.users = 0
+        self.animation_data = None
+
+    # index -1 keys every component of a vector property
+    def keyframe_insert(self, data_path, index=-1, frame=None):
+        if frame is None:
+            frame = context.scene.frame_current
+        if self.animation_data is None:
+            self.animation_data_create()
+        if self.animation_data.action is None:
+            self.animation_data.action = data.actions.new(self.name + "Action")
+        fcurves = self.animation_data.action.fcurves
+
+        value = getattr(self, data_path)
+        if isinstance(value, (tuple, list)):
+            values = list(enumerate(value)) if index < 0 else [ (index, value[index]) ]
+        else:
+            values = [ (0, value) ]
+
+        for i, v in values:
+            fcurve = fcurves.find(data_path, i) or fcurves.new(data_path, i)
+            fcurve.keyframe_points.insert(frame, float(v))
+        return True
+
+    def animation_data_create(self):
+        if self.animation_data is None:
+            self.animation_data = AnimData()
+        return self.animation_data
+
+    # the animated value of data_path at frame, or its current value
+    def evaluate(self, data_path, frame):
+        value = getattr(self, data_path)
+        fcurves = self.animation_data.action.fcurves if self.animation_data and self.animation_data.action else FCurves()
+        if isinstance(value, (tuple, list)):
+            return tuple(fcurves.find(data_path, i).evaluate(frame) if fcurves.find(data_path, i) else v
+                         for i, v in enumerate(value))
+        fcurve = fcurves.find(data_path)
+        return fcurve.evaluate(frame) if fcurve else value
+
+class Action(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.fcurves = FCurves()
+
+class Socket(object):
+    def __init__(self, node, name, default_value=None):
+        self.node = node
+        self.name = name
+        self.default_value = default_value
+        self.links = []
+
+class Sockets(object):
+    def __init__(self, node, names):
+        self.sockets = [ Socket(node, name, default) for name, default in names ]
+
+    def __len__(self):
+        return len(self.sockets)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.sockets[key]
+        for socket in self.sockets:
+            if socket.name == key:
+                return socket
+        raise KeyError("bpy_prop_collection[key]: key \"%s\" not found" % key)
+
+# inputs and outputs of the shader nodes the scripts use
+NODE_SOCKETS = {
+    'ShaderNodeAttribute': ([], [ ('Color', None), ('Vector', None), ('Fac', None) ]),
+    'ShaderNodeBsdfDiffuse': ([ ('Color', (0.8, 0.8, 0.8, 1.0)), ('Roughness', 0.0), ('Normal', None) ], [ ('BSDF', None) ]),
+    'ShaderNodeBsdfGlass': ([ ('Color', (1.0, 1.0, 1.0, 1.0)), ('Roughness', 0.0), ('IOR', 1.45), ('Normal', None) ], [ ('BSDF', None) ]),
+    'ShaderNodeAmbientOcclusion': ([ ('Color', (1.0, 1.0, 1.0, 1.0)) ], [ ('AO', None) ]),
+    'ShaderNodeMixShader': ([ ('Fac', 0.5), ('Shader', None), ('Shader', None) ], [ ('Shader', None) ]),
+    'ShaderNodeEmission': ([ ('Color', (1.0, 1.0, 1.0, 1.0)), ('Strength', 1.0) ], [ ('Emission', None) ]),
+    'ShaderNodeOutputMaterial': ([ ('Surface', None), ('Volume', None), ('Displacement', None) ], []),
+    'ShaderNodeOutputLamp': ([ ('Surface', None) ], []),
+}
+
+NODE_NAMES = {
+    'ShaderNodeAttribute': 'Attribute',
+    'ShaderNodeBsdfDiffuse': 'Diffuse BSDF',
+    'ShaderNodeBsdfGlass': 'Glass BSDF',
+    'ShaderNodeAmbientOcclusion': 'Ambient Occlusion',
+    'ShaderNodeMixShader': 'Mix Shader',
+    'ShaderNodeEmission': 'Emission',
+    'ShaderNodeOutputMaterial': 'Material Output',
+    'ShaderNodeOutputLamp': 'Lamp Output',
+}
+
+class Node(object):
+    def __init__(self, bl_idname):
+        if bl_idname not in NODE_SOCKETS:
+            raise RuntimeError("Error: Node type %s undefined" % bl_idname)
+        inputs, outputs = NODE_SOCKETS[bl_idname]
+        self.bl_idname = bl_idname
+        self.name = NODE_NAMES[bl_idname]
+        self.inputs = Sockets(self, inputs)
+        self.outputs = Sockets(self, outputs)
+        self.attribute_name = ''
+
+class Nodes(Collection):
+    def new(self, type):
+        return self.add(Node(type))
+
+class Link(object):
+    def __init__(self, from_socket, to_socket):
+        self.from_socket = from_socket
+        self.to_socket = to_socket
+
+class Links(object):
+    def __init__(self):
+        self.items = []
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def new(self, from_socket, to_socket):
+        # an input takes one link
+        self.items = [ l for l in self.items if l.to_socket is not to_socket ]
+        link = Link(from_socket, to_socket)
+        self.items.append(link)
+        return link
+
+class NodeTree(object):
+    def __init__(self, node_types):
+        self.nodes = Nodes()
+        self.links = Links()
+        for bl_idname in node_types:
+            self.nodes.new(bl_idname)
+
+class Material(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.node_tree = None
+
+    @property
+    def use_nodes(self):
+        return self.node_tree is not None
+
+    @use_nodes.setter
+    def use_nodes(self, value):
+        if value and self.node_tree is None:
+            self.node_tree = NodeTree([ 'ShaderNodeBsdfDiffuse', 'ShaderNodeOutputMaterial' ])
+            self.node_tree.links.new(self.node_tree.nodes['Diffuse BSDF'].outputs[0],
+                                     self.node_tree.nodes['Material Output'].inputs[0])
+
+class Polygons(object):
+    def __init__(self, count):
+        self.use_smooth = [ False ] * count
+
+    def __len__(self):
+        return len(self.use_smooth)
+
+    def foreach_set(self, attr, values):
+        if attr != 'use_smooth':
+            raise AttributeError("foreach_set: unsupported attribute '%s'" % attr)
+        if len(values) != len(self.use_smooth):
+            raise RuntimeError("foreach_set: array length mismatch")
+        self.use_smooth = [ bool(v) for v in values ]
+
+class Mesh(ID):
+    def __init__(self, name, num_vertices=0, num_faces=0):
+        ID.__init__(self, name)
+        self.num_vertices = num_vertices
+        self.polygons = Polygons(num_faces)
+        self.materials = []
+
+class Camera(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.type = 'PERSP'
+        self.ortho_scale = 7.314
+        self.lens = 35.0
+        self.clip_start = 0.1
+        self.clip_end = 100.0
+
+class Lamp(ID):
+    def __init__(self, name, type='POINT'):
+        ID.__init__(self, name)
+        self.type = type
+        self.shape = 'SQUARE'
+        self.size = 0.1
+        self.size_y = 0.1
+        self.shadow_soft_size = 0.25
+        self.node_tree = None
+
+    # lamps always get cycles nodes in the fake
+    @property
+    def use_nodes(self):
+        return self.node_tree is not None
+
+    @use_nodes.setter
+    def use_nodes(self, value):
+        if value and self.node_tree is None:
+            self.node_tree = NodeTree([ 'ShaderNodeEmission', 'ShaderNodeOutputLamp' ])
+            self.node_tree.links.new(self.node_tree.nodes['Emission'].outputs[0],
+                                     self.node_tree.nodes['Lamp Output'].inputs[0])
+
+class BezierPoint(object):
+    def __init__(self):
+        self.co = (0.0, 0.0, 0.0)
+        self.handle_left = (0.0, 0.0, 0.0)
+        self.handle_right = (0.0, 0.0, 0.0)
+        self.handle_left_type = 'FREE'
+        self.handle_right_type = 'FREE'
+
+class BezierPoints(object):
+    def __init__(self):
+        self.items = [ BezierPoint() ]
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        return self.items[i]
+
+    def add(self, count=1):
+        self.items.extend(BezierPoint() for _ in range(count))
+
+class Spline(object):
+    def __init__(self, type):
+        if type != 'BEZIER':
+            raise TypeError("enum \"%s\" not supported by the fake" % type)
+        self.type = type
+        self.bezier_points = BezierPoints()
+        self.use_cyclic_u = False
+
+class Splines(object):
+    def __init__(self):
+        self.items = []
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        return self.items[i]
+
+    def new(self, type):
+        spline = Spline(type)
+        self.items.append(spline)
+        return spline
+
+class Curve(ID):
+    def __init__(self, name, type='CURVE'):
+        ID.__init__(self, name)
+        self.type = type
+        self.dimensions = '3D'
+        self.splines = Splines()
+        self.path_duration = 100
+        self.use_path = True
+        self.eval_time = 0.0
+
+class World(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.light_settings = LightSettings()
+        self.horizon_color = (0.05, 0.05, 0.05)
+
+CONSTRAINT_NAMES = {
+    'FOLLOW_PATH': 'Follow Path',
+    'TRACK_TO': 'Track To',
+}
+
+class Constraint(object):
+    def __init__(self, type):
+        if type not in CONSTRAINT_NAMES:
+            raise TypeError("bpy_struct: item.attr = val: enum \"%s\" not found" % type)
+        self.type = type
+        self.name = CONSTRAINT_NAMES[type]
+        self.target = None
+        self.track_axis = 'TRACK_NEGATIVE_Z'
+        self.up_axis = 'UP_Y'
+        self.use_curve_follow = False
+        self.forward_axis = 'FORWARD_Y'
+
+class Constraints(Collection):
+    def new(self, type):
+        return self.add(Constraint(type))
+
+class Object(ID):
+    def __init__(self, name, object_data=None):
+        ID.__init__(self, name)
+        self.data = object_data
+        self.type = { Mesh: 'MESH', Camera: 'CAMERA', Lamp: 'LAMP', Curve: 'CURVE' }.get(type(object_data), 'EMPTY')
+        self.location = (0.0, 0.0, 0.0)
+        self.scale = (1.0, 1.0, 1.0)
+        self.rotation_euler = (0.0, 0.0, 0.0)
+        self.select = False
+        self.hide_render = False
+        self.empty_draw_type = 'PLAIN_AXES'
+        self.empty_draw_size = 1.0
+        self.constraints = Constraints()
+        if object_data is not None:
+            object_data.users += 1
+
+class SceneObjects(object):
+    def __init__(self):
+        self.items = []
+        self.active = None
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, name):
+        for item in self.items:
+            if item.name == name:
+                return item
+        raise KeyError("bpy_prop_collection[key]: key \"%s\" not found" % name)
+
+    def link(self, obj):
+        if obj in self.items:
+            raise RuntimeError("Error: Object '%s' already in scene" % obj.name)
+        self.items.append(obj)
+        obj.users += 1
+
+    def unlink(self, obj):
+        self.items.remove(obj)
+        obj.users -= 1
+        if self.active is obj:
+            self.active = None
+
+class Scene(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.render = RenderSettings()
+        self.cycles = CyclesSettings()
+        self.objects = SceneObjects()
+        self.camera = None
+        self.world = None
+        self.frame_start = 1
+        self.frame_end = 250
+        self.frame_current = 1
+
+    def frame_set(self, frame):
+        self.frame_current = frame
+        stats['updates'] += 1
+
+    def update(self):
+        stats['updates'] += 1
+
+class Data(object):
+    def __init__(self):
+        self.objects = Collection(Object)
+        self.meshes = Collection(Mesh)
+        self.cameras = Collection(Camera)
+        self.lamps = Collection(Lamp)
+        self.curves = Collection(Curve)
+        self.materials = Collection(Material)
+        self.actions = Collection(Action)
+        self.worlds = Collection(World)
+        self.scenes = Collection(Scene)
+
+class Context(object):
+    def __init__(self, scene):
+        self.scene = scene
+
+    @property
+    def object(self):
+        return self.scene.objects.active
+
+    active_object = object
+
+# operators are looked up as bpy.ops.<module>.<name>(...)
+class OperatorModule(object):
+    def __init__(self, module_name):
+        self.module_name = module_name
+
+    def __getattr__(self, name):
+        fn = OPERATORS.get((self.module_name, name))
+        if fn is None:
+            raise AttributeError("Calling operator \"bpy.ops.%s.%s\" error, could not be found" % (self.module_name, name))
+
+        def operator(*args, **kwargs):
+            key = "%s.%s" % (self.module_name, name)
+            stats['ops'] += 1
+            stats['updates'] += 1
+            stats['calls'][key] = stats['calls'].get(key, 0) + 1
+            return fn(*args, **kwargs)
+        return operator
+
+class Ops(object):
+    def __getattr__(self, module_name):
+        return OperatorModule(module_name)
+
+def _scene():
+    return context.scene
+
+def _add_object(name, object_data, location=(0.0, 0.0, 0.0)):
+    obj = data.objects.new(name, object_data)
+    obj.location = location
+    scene = _scene()
+    for other in scene.objects:
+        other.select = False
+    scene.objects.link(obj)
+    obj.select = True
+    scene.objects.active = obj
+    return obj
+
+def _op_camera_add(location=(0.0, 0.0, 0.0)):
+    _add_object('Camera', data.cameras.new('Camera'), location)
+    return {'FINISHED'}
+
+def _op_lamp_add(type='POINT', location=(0.0, 0.0, 0.0)):
+    lamp = data.lamps.new(type.capitalize(), type)
+    lamp.use_nodes = True
+    _add_object(type.capitalize(), lamp, location)
+    return {'FINISHED'}
+
+def _op_primitive_cube_add(location=(0.0, 0.0, 0.0)):
+    _add_object('Cube', data.meshes.new('Cube', 8, 6), location)
+    return {'FINISHED'}
+
+# four points on the unit circle starting at -x, with auto handles
+def _op_primitive_bezier_circle_add(location=(0.0, 0.0, 0.0)):
+    curve = data.curves.new('BezierCircle')
+    spline = curve.splines.new('BEZIER')
+    spline.bezier_points.add(3)
+    for point, co in zip(spline.bezier_points, [ (-1, 0, 0), (0, 1, 0), (1, 0, 0), (0, -1, 0) ]):
+        point.co = co
+        point.handle_left_type = point.handle_right_type = 'AUTO'
+    spline.use_cyclic_u = True
+    _add_object('BezierCircle', curve, location)
+    return {'FINISHED'}
+
+# reads the vertex and face counts from the ply header
+def _op_import_ply(filepath):
+    if not os.path.isfile(filepath):
+        raise RuntimeError("Error: Cannot open file %s" % filepath)
+
+    counts = { 'vertex': 0, 'face': 0 }
+    with open(filepath, 'rb') as f:
+        for line in f:
+            fields = line.decode('ascii', 'replace').split()
+            if fields[:1] == [ 'element' ] and fields[1] in counts:
+                counts[fields[1]] = int(fields[2])
+            elif fields[:1] == [ 'end_header' ]:
+                break
+
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    _add_object(name, data.meshes.new(name, counts['vertex'], counts['face']))
+    return {'FINISHED'}
+
+def _op_shade_smooth():
+    for obj in _scene().objects:
+        if obj.select and obj.type == 'MESH':
+            obj.data.polygons.foreach_set('use_smooth', [ True ] * len(obj.data.polygons))
+    return {'FINISHED'}
+
+def _op_select_all(action='TOGGLE'):
+    scene = _scene()
+    if action == 'TOGGLE':
+        action = 'DESELECT' if any(obj.select for obj in scene.objects) else 'SELECT'
+    for obj in scene.objects:
+        obj.select = (action == 'SELECT')
+    return {'FINISHED'}
+
+# every selected object except the active one gets a Track To constraint
+def _op_track_set(type='DAMPTRACK'):
+    if type != 'TRACKTO':
+        raise TypeError("enum \"%s\" not supported by the fake" % type)
+    scene = _scene()
+    target = scene.objects.active
+    for obj in scene.objects:
+        if obj.select and obj is not target:
+            constraint = obj.constraints.new('TRACK_TO')
+            constraint.target = target
+            constraint.track_axis = 'TRACK_NEGATIVE_Z'
+            constraint.up_axis = 'UP_Y'
+    return {'FINISHED'}
+
+def _op_followpath_path_animate(override=None, constraint='', frame_start=1, length=100):
+    override = override or {}
+    if 'constraint' not in override:
+        raise RuntimeError("Operator bpy.ops.constraint.followpath_path_animate.poll() failed, context is incorrect")
+    target = override['constraint'].target
+    if target is None or target.type != 'CURVE':
+        raise RuntimeError("Error: Follow Path constraint has no curve target")
+
+    # blender adds a generator modifier giving eval_time = (frame - frame_start) * 100 / length
+    curve = target.data
+    for frame, eval_time in ((frame_start, 0.0), (frame_start + length, 100.0)):
+        curve.eval_time = eval_time
+        curve.keyframe_insert('eval_time', frame=frame)
+    fcurve = curve.animation_data.action.fcurves.find('eval_time')
+    fcurve.extrapolation = 'LINEAR'
+    for k in fcurve.keyframe_points:
+        k.interpolation = 'LINEAR'
+    curve.eval_time = 0.0
+    return {'FINISHED'}
+
+def _op_render(animation=False, write_still=False):
+    scene = _scene()
+    if scene.camera is None:
+        raise RuntimeError("Error: No camera found in scene")
+    if animation:
+        frames = list(range(scene.frame_start, scene.frame_end + 1))
+    else:
+        frames = [ scene.frame_current ]
+    stats['renders'].append({ 'filepath': scene.render.filepath,
+                              'frames': frames,
+                              'animation': animation,
+                              'write_still': write_still })
+    return {'FINISHED'}
+
+def _op_read_factory_settings():
+    reset()
+    return {'FINISHED'}
+
+OPERATORS = {
+    ('object', 'camera_add'): _op_camera_add,
+    ('object', 'lamp_add'): _op_lamp_add,
+    ('mesh', 'primitive_cube_add'): _op_primitive_cube_add,
+    ('curve', 'primitive_bezier_circle_add'): _op_primitive_bezier_circle_add,
+    ('import_mesh', 'ply'): _op_import_ply,
+    ('object', 'shade_smooth'): _op_shade_smooth,
+    ('object', 'select_all'): _op_select_all,
+    ('object', 'track_set'): _op_track_set,
+    ('constraint', 'followpath_path_animate'): _op_followpath_path_animate,
+    ('render', 'render'): _op_render,
+    ('wm', 'read_factory_settings'): _op_read_factory_settings,
+}
+
+# blender's startup file: a cube, a camera, a lamp and a world
+def reset():
+    global data, context, ops, stats
+
+    data = Data()
+    scene = data.scenes.new('Scene')
+    scene.world = data.worlds.new('World')
+    context = Context(scene)
+    ops = Ops()
+    stats = { 'ops': 0, 'updates': 0, 'calls': {}, 'renders': [] }
+
+    _op_primitive_cube_add()
+    _op_lamp_add(type='POINT', location=(4.08, 1.0, 5.9))
+    _op_camera_add(location=(7.48, -6.5, 5.34))
+    scene.camera = data.objects['Camera']
+
+def reset_stats():
+    stats.update({ 'ops': 0, 'updates': 0, 'calls': {}, 'renders': [] })
+
+# make "import bpy" return this module
+def install():
+    reset()
+    sys.modules['bpy'] = sys.modules[__name__]
+
+reset()
+
+# time building the project scenes against the fake
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    import tempfile
+    import blenderscene
+
+    install()
+
+    fd, ply_file = tempfile.mkstemp(suffix='.ply')
+    with os.fdopen(fd, 'w') as f:
+        f.write("ply\nformat ascii 1.0\nelement vertex 0\nelement face 0\nend_header\n")
+
+    try:
+        scenes = [ ('turntable', blenderscene.turntable_scene(ply_file, '/tmp/frames/', 1.88, 0.0, 300)),
+                   ('turntable glass_ao', blenderscene.turntable_scene(ply_file, '/tmp/frames/', 10, 0.0, 300, material='glass_ao')),
+                   ('turntable keyframes', blenderscene.turntable_scene(ply_file, '/tmp/frames/', 1.88, 0.0, 300, spin='keyframes')),
+                   ('turntable object', blenderscene.turntable_scene(ply_file, '/tmp/frames/', 1.88, 0.0, 300, spin='object')) ]
+
+        for name, scene in scenes:
+            reset_stats()
+            start = time.time()
+            for _ in range(args.repeat):
+                blenderscene.apply_scene(scene)
+            seconds = (time.time() - start) / args.repeat
+            print("%-20s %4.1f operator calls, %4.1f depsgraph updates, %.3f ms per scene" %
+                  (name, stats['ops'] / float(args.repeat), stats['updates'] / float(args.repeat), seconds * 1000))
+    finally:
+        os.remove(ply_file)
+
+if __name__ == "__main__": main()
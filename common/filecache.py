@@ -0,0 +1,107 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+# file hashes by (path, size, mtime), so a file shared by many jobs or keys
+# is only read once
+_file_hashes = {}
+
+def file_hash(file_name, block_size=1<<20):
+    st = os.stat(file_name)
+    stamp = (os.path.abspath(file_name), st.st_size, st.st_mtime)
+    if stamp in _file_hashes:
+        return _file_hashes[stamp]
+
+    h = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+
+    _file_hashes[stamp] = h.hexdigest()
+    return _file_hashes[stamp]
+
+# content-addressed store of generated files.  each entry is a directory named
+# by its key holding one or more files, given as { name in the entry: path }.
+# hits touch the entry, and the least recently used entries are evicted once
+# the total size goes over max_bytes.
+class FileCache(object):
+    def __init__(self, cache_dir, max_bytes=10 * (1<<30)):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # another worker got there first
+                if not os.path.isdir(cache_dir):
+                    raise
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    # copy an entry's files to their destinations.  returns False on a miss.
+    def get(self, key, files):
+        entry_dir = self.entry_dir(key)
+
+        try:
+            for name, file_name in files.items():
+                shutil.copyfile(os.path.join(entry_dir, name), file_name)
+            os.utime(entry_dir, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    # add an entry without evicting, call evict() once a batch is in
+    def add(self, key, files):
+        entry_dir = self.entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        # stage the entry and move it into place so readers never see a partial one
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp')
+        try:
+            for name, file_name in files.items():
+                shutil.copyfile(file_name, os.path.join(tmp_dir, name))
+            os.rename(tmp_dir, entry_dir)
+        except (IOError, OSError):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def put(self, key, files):
+        self.add(key, files)
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.entry_dir(key)
+            if key.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+                entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+            except OSError:
+                pass
+        return entries
+
+    def size(self):
+        return sum(e[1] for e in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+
+        for mtime, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
@@ -0,0 +1,42 @@
+import os
+import hashlib
+import json
+
+import renderpresets
+from filecache import file_hash
+
+# bump when rendering changes in a way that invalidates old frames
+CACHE_VERSION = 2
+
+# the scripts build their scenes with these modules, so they're part of every key
+COMMON_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENE_MODULES = [ os.path.join(COMMON_DIR, name)
+                  for name in ( 'blenderscene.py', 'turntable.py', 'renderpresets.py' ) ]
+
+# job fields that don't change what a frame looks like.  the preset and its
+# overrides are keyed by the render profile they resolve to instead.
+UNKEYED_FIELDS = ( 'ply', 'outdir', 'script', 'frame_start', 'frame_end', 'resume',
+                   'preset', 'render_settings' )
+
+# each cache entry holds one frame under this name
+FRAME_NAME = 'frame.png'
+
+# the part of a frame's key shared by all of a job's frames: the ply's content,
+# every job setting that changes the picture (camera scale and height, path
+# length, resolution, material, cycles settings, ...) and the blender script
+# and scene modules, which place the lights and set up the materials
+def scene_hash(job, script):
+    settings = { k: v for k, v in job.items() if k not in UNKEYED_FIELDS }
+    settings['render'] = renderpresets.render_profile(job['preset'], job['render_settings'])
+
+    h = hashlib.sha1()
+    h.update(("v%d" % CACHE_VERSION).encode('ascii'))
+    h.update(file_hash(job['ply']).encode('ascii'))
+    h.update(file_hash(script).encode('ascii'))
+    for module in SCENE_MODULES:
+        h.update(file_hash(module).encode('ascii'))
+    h.update(json.dumps(settings, sort_keys=True).encode('ascii'))
+    return h.hexdigest()
+
+def frame_key(scene, frame):
+    return "%s_%04d" % (scene, frame)
@@ -0,0 +1,58 @@
+import numpy as np
+
+# write a triangle mesh straight from numpy buffers.  points is (N,3),
+# faces is (M,3) vertex indices, colors is an optional (N,3) uint8 array.
+# binary output is little-endian with the same properties vtkPLYWriter emits,
+# so blender's importer picks the colors up as the 'Col' layer either way.
+def write_ply(filename, points, faces, colors=None, binary=True):
+    points = np.asarray(points)
+    faces = np.asarray(faces)
+
+    vertex_fields = [ ('x','<f4'), ('y','<f4'), ('z','<f4') ]
+    if colors is not None:
+        vertex_fields += [ ('red','u1'), ('green','u1'), ('blue','u1') ]
+
+    vertices = np.empty(points.shape[0], dtype=vertex_fields)
+    vertices['x'] = points[:,0]
+    vertices['y'] = points[:,1]
+    vertices['z'] = points[:,2]
+    if colors is not None:
+        colors = np.asarray(colors)
+        vertices['red'] = colors[:,0]
+        vertices['green'] = colors[:,1]
+        vertices['blue'] = colors[:,2]
+
+    header = [ "ply",
+               "format %s 1.0" % ("binary_little_endian" if binary else "ascii"),
+               "element vertex %d" % points.shape[0],
+               "property float x",
+               "property float y",
+               "property float z" ]
+    if colors is not None:
+        header += [ "property uchar red",
+                    "property uchar green",
+                    "property uchar blue" ]
+    header += [ "element face %d" % faces.shape[0],
+                "property list uchar int vertex_indices",
+                "end_header" ]
+
+    with open(filename, 'wb') as f:
+        f.write(("\n".join(header) + "\n").encode('ascii'))
+
+        if binary:
+            tris = np.empty(faces.shape[0], dtype=[ ('n','u1'), ('v','<i4',(3,)) ])
+            tris['n'] = 3
+            tris['v'] = faces
+
+            vertices.tofile(f)
+            tris.tofile(f)
+        else:
+            rows = points.astype(np.float32).astype(np.float64)
+            vfmt = "%.9g %.9g %.9g"
+            if colors is not None:
+                rows = np.column_stack([ rows, colors ])
+                vfmt += " %d %d %d"
+            np.savetxt(f, rows, fmt=vfmt)
+
+            tris = np.column_stack([ np.full(faces.shape[0], 3), faces ])
+            np.savetxt(f, tris, fmt="%d")
@@ -0,0 +1,501 @@
+import os
+import sys
+import csv
+import struct
+import shutil
+import json
+import argparse
+import tempfile
+import subprocess
+import concurrent.futures
+
+import filecache
+import framecache
+import renderpresets
+
+# every render job has these fields.  ply and outdir are required, the rest
+# fall back to these defaults.  outdir is blender's render.filepath, so frames
+# land at outdir + '0001.png' and it can be a directory or a file name prefix.
+# frame_start and frame_end (default 1 and steps) select part of the turntable.
+# with resume on, blender skips frames that are already complete pngs.
+# spin is 'path' (the camera follows a circle), 'keyframes' (exact camera
+# poses keyed per frame, elevation in degrees, any number of revolutions) or
+# 'object' (the camera and lights stay put and the mesh turns).  preset names
+# a render quality preset and render_settings overrides any of its values.
+# without a material the blender script uses its own.
+JOB_DEFAULTS = {
+    'scale': 1.88,
+    'z': 0.0,
+    'steps': 300,
+    'resolution': 100,
+    'resolution_x': 5940,
+    'resolution_y': 3600,
+    'material': None,
+    'script': None,
+    'frame_start': 1,
+    'frame_end': None,
+    'resume': True,
+    'spin': 'path',
+    'radius': 10.0,
+    'elevation': 0.0,
+    'revolutions': 1.0,
+    'preset': renderpresets.DEFAULT_PRESET,
+    'render_settings': None
+}
+
+# a dict, or a json object in a csv cell
+def parse_dict(v):
+    return v if isinstance(v, dict) else json.loads(v)
+
+JOB_TYPES = {
+    'ply': str,
+    'outdir': str,
+    'scale': float,
+    'z': float,
+    'steps': int,
+    'resolution': int,
+    'resolution_x': int,
+    'resolution_y': int,
+    'material': str,
+    'script': str,
+    'frame_start': int,
+    'frame_end': int,
+    'resume': renderpresets.parse_bool,
+    'spin': str,
+    'radius': float,
+    'elevation': float,
+    'revolutions': float,
+    'preset': str,
+    'render_settings': parse_dict
+}
+
+MATERIALS = ( 'diffuse', 'glass', 'glass_ao' )
+
+SPIN_MODES = ( 'path', 'keyframes', 'object' )
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_IEND = b'\x00\x00\x00\x00IEND' + struct.pack('>I', 0xae426082)
+
+def make_job(fields, defaults=None):
+    job = dict(JOB_DEFAULTS)
+    job.update(defaults or {})
+    job.update({ k: v for k, v in fields.items() if v not in (None, '') })
+
+    for required in ('ply', 'outdir'):
+        if not job.get(required):
+            raise ValueError("render job is missing '%s': %s" % (required, fields))
+
+    for k, v in list(job.items()):
+        if v is not None and k in JOB_TYPES:
+            job[k] = JOB_TYPES[k](v)
+
+    if job['frame_end'] is None:
+        job['frame_end'] = job['steps']
+
+    if not 1 <= job['frame_start'] <= job['frame_end'] <= job['steps']:
+        raise ValueError("frames %d-%d are outside 1-%d" % (job['frame_start'], job['frame_end'], job['steps']))
+
+    if job['material'] is not None and job['material'] not in MATERIALS:
+        raise ValueError("unknown material '%s', expected one of %s" % (job['material'], MATERIALS))
+
+    # raises on an unknown preset or setting
+    renderpresets.render_profile(job['preset'], job['render_settings'])
+
+    if job['spin'] not in SPIN_MODES:
+        raise ValueError("unknown spin '%s', expected one of %s" % (job['spin'], SPIN_MODES))
+
+    if job['spin'] == 'path' and job['revolutions'] != 1:
+        raise ValueError("a path turntable makes one revolution, use spin 'keyframes'")
+
+    return job
+
+# a manifest is either a json list of jobs, a json object with "defaults" and
+# "jobs", or a csv file with one job per row and the field names as header.
+# relative ply and outdir paths are taken relative to the manifest.
+def read_manifest(file_name):
+    if file_name.lower().endswith('.csv'):
+        with open(file_name, 'r') as f:
+            rows = list(csv.DictReader(f))
+        defaults = {}
+    else:
+        with open(file_name, 'r') as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict):
+            rows = manifest.get('jobs', [])
+            defaults = manifest.get('defaults', {})
+        else:
+            rows = manifest
+            defaults = {}
+
+    base_dir = os.path.dirname(os.path.abspath(file_name))
+
+    jobs = []
+    for row in rows:
+        job = make_job(row, defaults)
+        for k in ('ply', 'outdir'):
+            if not os.path.isabs(job[k]):
+                # keep a trailing separator, it matters for outdir
+                job[k] = os.path.join(base_dir, job[k])
+        jobs.append(job)
+
+    return jobs
+
+def write_manifest(file_name, jobs):
+    with open(file_name, 'w') as f:
+        json.dump({ 'jobs': jobs }, f, indent=2)
+
+# one job per subdirectory of root_dir holding ply_name
+def directory_jobs(root_dir, ply_name='recon.ply', defaults=None):
+    jobs = []
+    for dir_name in sorted(os.listdir(root_dir)):
+        ply_file = os.path.join(root_dir, dir_name, ply_name)
+        if os.path.isfile(ply_file):
+            jobs.append(make_job({ 'ply': ply_file,
+                                   'outdir': os.path.join(root_dir, dir_name) + os.sep }, defaults))
+    return jobs
+
+def frame_file_name(outdir, frame):
+    return "%s%04d.png" % (outdir, frame)
+
+def job_frames(job):
+    return range(job['frame_start'], job['frame_end'] + 1)
+
+# a frame is 'ok' if it starts with the png signature and ends with the IEND
+# chunk, 'invalid' if it exists but doesn't (blender died while writing it)
+def frame_status(file_name):
+    try:
+        size = os.path.getsize(file_name)
+    except OSError:
+        return 'missing'
+
+    if size < len(PNG_SIGNATURE) + len(PNG_IEND):
+        return 'invalid'
+
+    with open(file_name, 'rb') as f:
+        signature = f.read(len(PNG_SIGNATURE))
+        f.seek(-len(PNG_IEND), os.SEEK_END)
+        iend = f.read()
+
+    return 'ok' if signature == PNG_SIGNATURE and iend == PNG_IEND else 'invalid'
+
+def scan_frames(job):
+    status = {}
+    for frame in job_frames(job):
+        status[frame] = frame_status(frame_file_name(job['outdir'], frame))
+    return status
+
+# frames that are missing or invalid and have to be rendered again
+def missing_frames(job):
+    return [ frame for frame, status in sorted(scan_frames(job).items()) if status != 'ok' ]
+
+def job_complete(job):
+    return len(missing_frames(job)) == 0
+
+def make_outdir(job):
+    outdir_parent = os.path.dirname(frame_file_name(job['outdir'], 1))
+    if outdir_parent and not os.path.exists(outdir_parent):
+        try:
+            os.makedirs(outdir_parent)
+        except OSError:
+            if not os.path.isdir(outdir_parent):
+                raise
+
+# split a job's frames into num_shards contiguous ranges of nearly equal size
+def shard_job(job, num_shards):
+    frames = list(job_frames(job))
+    num_shards = max(1, min(num_shards, len(frames)))
+
+    shards = []
+    for i in range(num_shards):
+        lo = frames[len(frames) * i // num_shards]
+        hi = frames[len(frames) * (i + 1) // num_shards - 1]
+        shard = dict(job)
+        shard['frame_start'] = lo
+        shard['frame_end'] = hi
+        shards.append(shard)
+    return shards
+
+def shard_jobs(jobs, num_shards):
+    return [ shard for job in jobs for shard in shard_job(job, num_shards) ]
+
+# where job number job_index writes its frames on a node that renders into a
+# local shard_root instead of the shared outdir
+def shard_outdir(shard_root, job_index, job):
+    return os.path.join(shard_root, "%04d" % job_index, os.path.basename(job['outdir']))
+
+# copy the frames found under each shard root back into the jobs' outdirs.
+# returns job index -> frames still missing afterwards.
+def merge_shards(jobs, shard_roots):
+    missing = {}
+    for job_index, job in enumerate(jobs):
+        make_outdir(job)
+
+        for frame in missing_frames(job):
+            for shard_root in shard_roots:
+                src = frame_file_name(shard_outdir(shard_root, job_index, job), frame)
+                if frame_status(src) == 'ok':
+                    shutil.copyfile(src, frame_file_name(job['outdir'], frame))
+                    break
+
+        job_missing = missing_frames(job)
+        if job_missing:
+            missing[job_index] = job_missing
+
+    return missing
+
+# sorted frame numbers -> list of (first, last) runs of consecutive frames
+def contiguous_ranges(frames):
+    ranges = []
+    for frame in frames:
+        if ranges and frame == ranges[-1][1] + 1:
+            ranges[-1][1] = frame
+        else:
+            ranges.append([frame, frame])
+    return [ tuple(r) for r in ranges ]
+
+def frame_ranges(frames):
+    return ", ".join("%d" % a if a == b else "%d-%d" % (a, b) for a, b in contiguous_ranges(frames))
+
+# the frame ranges a job still has to render: all of them, or with resume on
+# only the runs of missing and invalid frames
+def render_ranges(job):
+    if not job.get('resume', True):
+        return [ (job['frame_start'], job['frame_end']) ]
+    return contiguous_ranges(missing_frames(job))
+
+# per job counts of ok, missing and invalid frames
+def verify_jobs(jobs):
+    report = []
+    for job in jobs:
+        status = scan_frames(job)
+        missing = [ f for f in sorted(status) if status[f] == 'missing' ]
+        invalid = [ f for f in sorted(status) if status[f] == 'invalid' ]
+        report.append({ 'outdir': job['outdir'],
+                        'frames': len(status),
+                        'ok': len(status) - len(missing) - len(invalid),
+                        'missing': missing,
+                        'invalid': invalid })
+    return report
+
+def print_report(report):
+    for entry in report:
+        if entry['missing'] or entry['invalid']:
+            print("%s: %d/%d ok" % (entry['outdir'], entry['ok'], entry['frames']))
+            if entry['missing']:
+                print("  missing %s" % frame_ranges(entry['missing']))
+            if entry['invalid']:
+                print("  invalid %s" % frame_ranges(entry['invalid']))
+
+    complete = sum(1 for entry in report if entry['ok'] == entry['frames'])
+    print("%d of %d jobs complete" % (complete, len(report)))
+
+# split jobs into groups of group_size that share a script, one group per
+# blender process
+def group_jobs(jobs, group_size=1):
+    by_script = {}
+    for job in jobs:
+        by_script.setdefault(job['script'], []).append(job)
+
+    groups = []
+    for script in sorted(by_script, key=lambda s: s or ''):
+        script_jobs = by_script[script]
+        for i in range(0, len(script_jobs), max(group_size, 1)):
+            groups.append(script_jobs[i:i+group_size])
+    return groups
+
+# arguments after '--' on the blender command line are left for the script
+def blender_command(blender, script, jobs_file):
+    return [ blender, '--background', '--python', script, '--', '--jobs', jobs_file ]
+
+# read the --jobs file named in sys.argv, from inside blender
+def jobs_from_argv(argv=None):
+    argv = sys.argv if argv is None else argv
+    argv = argv[argv.index('--') + 1:] if '--' in argv else []
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', default=None)
+    args, _ = parser.parse_known_args(argv)
+
+    if args.jobs is None:
+        return None
+
+    with open(args.jobs, 'r') as f:
+        return json.load(f)
+
+# copy the job's missing frames out of the frame cache.  returns the number
+# of frames restored.
+def restore_cached_frames(job, cache, script):
+    frames = missing_frames(job)
+    if not frames:
+        return 0
+
+    make_outdir(job)
+    scene = framecache.scene_hash(job, script)
+    return sum(1 for frame in frames
+               if cache.get(framecache.frame_key(scene, frame),
+                            { framecache.FRAME_NAME: frame_file_name(job['outdir'], frame) }))
+
+def store_frames(job, cache, script):
+    scene = framecache.scene_hash(job, script)
+    for frame, status in sorted(scan_frames(job).items()):
+        if status == 'ok':
+            cache.add(framecache.frame_key(scene, frame),
+                      { framecache.FRAME_NAME: frame_file_name(job['outdir'], frame) })
+    cache.evict()
+
+def run_group(group, blender, default_script):
+    script = group[0]['script'] or default_script
+
+    fd, jobs_file = tempfile.mkstemp(prefix='render_jobs', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(group, f)
+        returncode = subprocess.call(blender_command(blender, script, jobs_file))
+    finally:
+        os.remove(jobs_file)
+
+    return returncode
+
+# render jobs in groups, at most max_concurrent blender processes at a time
+def render_groups(jobs, blender, default_script, max_concurrent, group_size, cache):
+    results = []
+    groups = group_jobs(jobs, group_size)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(max_concurrent, 1)) as executor:
+        futures = { executor.submit(run_group, group, blender, default_script): group for group in groups }
+        for future in concurrent.futures.as_completed(futures):
+            group = futures[future]
+            returncode = future.result()
+            for job in group:
+                if cache is not None:
+                    store_frames(job, cache, job['script'] or default_script)
+
+                if returncode == 0 and job_complete(job):
+                    status = 'rendered'
+                else:
+                    status = 'failed'
+                results.append({ 'job': job, 'status': status, 'returncode': returncode })
+                print("%s: %s" % (job['outdir'], status))
+
+    return results
+
+def restore_job(job, cache, script):
+    if restore_cached_frames(job, cache, script) and job_complete(job):
+        print("%s: cached" % job['outdir'])
+        return { 'job': job, 'status': 'cached' }
+    return None
+
+# run every incomplete job.  blender only renders the frames that are missing
+# unless force is set.  with a FileCache, frames of scenes rendered before are
+# copied instead, new frames are added to the cache, and a job that repeats an
+# earlier job's scene and frames waits for it and copies its frames.  returns
+# one result dict per job.
+def run_jobs(jobs, blender='blender', default_script=None, max_concurrent=1, group_size=1, force=False, cache=None):
+    results = []
+    pending = []
+    duplicates = []
+    scenes = set()
+    for job in jobs:
+        script = job['script'] or default_script
+
+        if force:
+            pending.append(dict(job, resume=False))
+            continue
+
+        if job_complete(job):
+            results.append({ 'job': job, 'status': 'skipped' })
+            continue
+
+        if cache is not None:
+            result = restore_job(job, cache, script)
+            if result is not None:
+                results.append(result)
+                continue
+
+            scene = (framecache.scene_hash(job, script), job['frame_start'], job['frame_end'])
+            if scene in scenes:
+                duplicates.append(job)
+                continue
+            scenes.add(scene)
+
+        pending.append(job)
+
+    results.extend(render_groups(pending, blender, default_script, max_concurrent, group_size, cache))
+
+    # anything the first pass didn't leave in the cache is rendered after all
+    retry = []
+    for job in duplicates:
+        result = restore_job(job, cache, job['script'] or default_script)
+        if result is not None:
+            results.append(result)
+        else:
+            retry.append(job)
+
+    results.extend(render_groups(retry, blender, default_script, max_concurrent, group_size, cache))
+
+    return results
+
+def main():
+    default_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'celltypes', 'spinning_camera.py')
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest')
+    parser.add_argument('--blender', default='blender')
+    parser.add_argument('--script', default=os.path.normpath(default_script))
+    parser.add_argument('--max_concurrent', default=1, type=int)
+    parser.add_argument('--group_size', default=1, type=int, help='jobs per blender process')
+    parser.add_argument('--force', action='store_true', help='render jobs whose frames already exist')
+    parser.add_argument('--shards', default=1, type=int, help='split every job into this many frame ranges')
+    parser.add_argument('--shard', default=None, help='I/N: only render frame range I (from 0) of N, for one node')
+    parser.add_argument('--shard_root', default=None, help='with --shard, write frames under this directory')
+    parser.add_argument('--merge', default=None, nargs='+', help='copy frames from these shard roots and verify')
+    parser.add_argument('--verify', action='store_true', help='only report missing and invalid frames')
+    parser.add_argument('--report', default=None, help='also write the verification report to this json file')
+    parser.add_argument('--cache_dir', default=None, help='reuse frames of identical scenes from this directory')
+    parser.add_argument('--cache_size_mb', default=20000, type=int)
+    args = parser.parse_args()
+
+    jobs = read_manifest(args.manifest)
+
+    if args.merge or args.verify:
+        # only a merge writes anything, a plain verify leaves the output alone
+        if args.merge:
+            merge_shards(jobs, args.merge)
+        report = verify_jobs(jobs)
+        print_report(report)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+        sys.exit(0 if all(entry['ok'] == entry['frames'] for entry in report) else 1)
+
+    if args.shard is not None:
+        index, count = [ int(v) for v in args.shard.split('/') ]
+        node_jobs = []
+        for job_index, job in enumerate(jobs):
+            shards = shard_job(job, count)
+            if index < len(shards):
+                shard = shards[index]
+                if args.shard_root:
+                    shard['outdir'] = shard_outdir(args.shard_root, job_index, job)
+                node_jobs.append(shard)
+        jobs = node_jobs
+    elif args.shards > 1:
+        jobs = shard_jobs(jobs, args.shards)
+
+    cache = filecache.FileCache(args.cache_dir, args.cache_size_mb * (1<<20)) if args.cache_dir else None
+
+    results = run_jobs(jobs, blender=args.blender, default_script=args.script,
+                       max_concurrent=args.max_concurrent, group_size=args.group_size, force=args.force,
+                       cache=cache)
+
+    counts = {}
+    for r in results:
+        counts[r['status']] = counts.get(r['status'], 0) + 1
+    print(", ".join("%d %s" % (counts[k], k) for k in sorted(counts)))
+    if cache is not None:
+        print("frame cache: %d hits, %d misses, %.1f MB" % (cache.hits, cache.misses, cache.size() / float(1<<20)))
+
+    if counts.get('failed'):
+        sys.exit(1)
+
+if __name__ == "__main__": main()
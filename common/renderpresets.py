@@ -0,0 +1,86 @@
+# cycles quality/performance presets.  a render profile is a preset's values
+# with any per-job overrides on top, and blenderscene.setup_render applies it.
+#
+#   samples               path tracing samples per pixel
+#   *_bounces             light path limits.  the glass materials need enough
+#                         transmission and transparent bounces to see through
+#                         overlapping tubes, the rest can stay low.
+#   tile_size             render tile edge in pixels (cpu likes small tiles)
+#   denoise               run the denoiser on the result (2.79 and later)
+#   threads               render threads, 0 for one per core
+#
+# no preset (the default) leaves blender's own settings alone, apart from any
+# overrides.
+
+RENDER_PRESETS = {
+    'preview': {
+        'samples': 16,
+        'max_bounces': 4,
+        'diffuse_bounces': 1,
+        'glossy_bounces': 1,
+        'transmission_bounces': 4,
+        'transparent_max_bounces': 4,
+        'tile_size': 64,
+        'denoise': True,
+        'threads': 0
+    },
+    'draft': {
+        'samples': 64,
+        'max_bounces': 8,
+        'diffuse_bounces': 2,
+        'glossy_bounces': 2,
+        'transmission_bounces': 8,
+        'transparent_max_bounces': 8,
+        'tile_size': 64,
+        'denoise': True,
+        'threads': 0
+    },
+    'final': {
+        'samples': 256,
+        'max_bounces': 12,
+        'diffuse_bounces': 3,
+        'glossy_bounces': 4,
+        'transmission_bounces': 12,
+        'transparent_max_bounces': 12,
+        'tile_size': 32,
+        'denoise': False,
+        'threads': 0
+    }
+}
+
+DEFAULT_PRESET = None
+
+# csv manifests give every field as a string, so 'false' has to be false
+def parse_bool(v):
+    if isinstance(v, bool):
+        return v
+    s = str(v).strip().lower()
+    if s in ('1', 'true', 'yes'):
+        return True
+    if s in ('0', 'false', 'no'):
+        return False
+    raise ValueError("expected a boolean, got '%s'" % v)
+
+RENDER_TYPES = {
+    'samples': int,
+    'max_bounces': int,
+    'diffuse_bounces': int,
+    'glossy_bounces': int,
+    'transmission_bounces': int,
+    'transparent_max_bounces': int,
+    'tile_size': int,
+    'denoise': parse_bool,
+    'threads': int
+}
+
+def render_profile(preset=DEFAULT_PRESET, overrides=None):
+    if preset is not None and preset not in RENDER_PRESETS:
+        raise ValueError("unknown render preset '%s', expected one of %s" % (preset, sorted(RENDER_PRESETS)))
+
+    profile = dict(RENDER_PRESETS[preset]) if preset is not None else {}
+    for k, v in (overrides or {}).items():
+        if k not in RENDER_TYPES:
+            raise ValueError("unknown render setting '%s', expected one of %s" % (k, sorted(RENDER_TYPES)))
+        profile[k] = RENDER_TYPES[k](v)
+
+    return profile
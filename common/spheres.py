@@ -0,0 +1,61 @@
+import numpy as np
+
+# unit sphere as (points, triangles).  points are laid out as the north pole,
+# (phi_resolution - 2) rings of theta_resolution points, then the south pole.
+def sphere_template(theta_resolution=16, phi_resolution=8):
+    nrings = phi_resolution - 2
+
+    phi = np.linspace(0, np.pi, phi_resolution)[1:-1]
+    theta = np.linspace(0, 2 * np.pi, theta_resolution, endpoint=False)
+
+    ring_points = np.empty((nrings, theta_resolution, 3), dtype=np.float32)
+    ring_points[:,:,0] = np.outer(np.sin(phi), np.cos(theta))
+    ring_points[:,:,1] = np.outer(np.sin(phi), np.sin(theta))
+    ring_points[:,:,2] = np.cos(phi)[:,np.newaxis]
+
+    points = np.concatenate([ [[0, 0, 1]],
+                              ring_points.reshape(-1,3),
+                              [[0, 0, -1]] ]).astype(np.float32)
+
+    north = 0
+    south = points.shape[0] - 1
+
+    # ring[r, t] is the point id of theta step t on ring r
+    ring = 1 + np.arange(nrings * theta_resolution).reshape(nrings, theta_resolution)
+    ring_next = np.roll(ring, -1, axis=1)
+
+    top = np.column_stack([ np.full(theta_resolution, north), ring[0], ring_next[0] ])
+    bottom = np.column_stack([ np.full(theta_resolution, south), ring_next[-1], ring[-1] ])
+
+    # split each quad between neighboring rings into two triangles
+    a, b = ring[:-1].ravel(), ring_next[:-1].ravel()
+    c, d = ring[1:].ravel(), ring_next[1:].ravel()
+    quads = np.concatenate([ np.column_stack([a, c, d]),
+                             np.column_stack([a, d, b]) ])
+
+    faces = np.concatenate([ top, quads, bottom ]).astype(np.int32)
+
+    return points, faces
+
+# one sphere per center, built from a single template with broadcasting.
+# radius is a scalar or one value per center, colors are one rgb row per center.
+def sphere_cloud(centers, radius, colors, theta_resolution=16, phi_resolution=8):
+    centers = np.asarray(centers, dtype=np.float32).reshape(-1,3)
+    colors = np.asarray(colors, dtype=np.uint8).reshape(-1,3)
+    radius = np.broadcast_to(np.asarray(radius, dtype=np.float32), centers.shape[:1])
+
+    tpoints, tfaces = sphere_template(theta_resolution, phi_resolution)
+    n = centers.shape[0]
+    npts = tpoints.shape[0]
+
+    points = centers[:,np.newaxis,:] + radius[:,np.newaxis,np.newaxis] * tpoints[np.newaxis,:,:]
+
+    face_offsets = np.arange(n, dtype=np.int64)[:,np.newaxis,np.newaxis] * npts
+    faces = tfaces[np.newaxis,:,:] + face_offsets
+
+    if faces.size and faces.max() <= np.iinfo(np.int32).max:
+        faces = faces.astype(np.int32)
+
+    point_colors = np.repeat(colors, npts, axis=0)
+
+    return points.reshape(-1,3), faces.reshape(-1,3), point_colors
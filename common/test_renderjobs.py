@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import stat
+import shutil
+import tempfile
+import unittest
+
+import renderjobs
+
+# stands in for the blender executable.  it logs its command line and when
+# it ran, then writes a valid png for every frame render_ranges asks for.
+STUB_BLENDER = """#!%(python)s
+import os, sys, json, time, zlib, struct
+sys.path.insert(0, %(common)r)
+import renderjobs
+
+def chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+png = (renderjobs.PNG_SIGNATURE +
+       chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 0, 0, 0, 0)) +
+       chunk(b'IDAT', zlib.compress(b'\\x00\\x00')) +
+       chunk(b'IEND', b''))
+
+start = time.time()
+jobs = renderjobs.jobs_from_argv(sys.argv)
+time.sleep(0.2)
+for job in jobs:
+    renderjobs.make_outdir(job)
+    for first, last in renderjobs.render_ranges(job):
+        for frame in range(first, last + 1):
+            with open(renderjobs.frame_file_name(job['outdir'], frame), 'wb') as f:
+                f.write(png)
+
+log_file = os.path.join(%(log_dir)r, '%%d.json' %% os.getpid())
+with open(log_file, 'w') as f:
+    json.dump({ 'argv': sys.argv, 'start': start, 'end': time.time(),
+                'outdirs': [ job['outdir'] for job in jobs ] }, f)
+"""
+
+class RunJobsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.tmp_dir, 'log')
+        os.makedirs(self.log_dir)
+
+        self.blender = os.path.join(self.tmp_dir, 'blender')
+        with open(self.blender, 'w') as f:
+            f.write(STUB_BLENDER % { 'python': sys.executable,
+                                     'common': os.path.dirname(os.path.abspath(__file__)),
+                                     'log_dir': self.log_dir })
+        os.chmod(self.blender, os.stat(self.blender).st_mode | stat.S_IEXEC)
+
+        with open(os.path.join(self.tmp_dir, 'mesh.ply'), 'w') as f:
+            f.write('ply\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def calls(self):
+        calls = []
+        for name in os.listdir(self.log_dir):
+            with open(os.path.join(self.log_dir, name), 'r') as f:
+                calls.append(json.load(f))
+        return calls
+
+    def write_json_manifest(self, outdirs, steps=3):
+        file_name = os.path.join(self.tmp_dir, 'manifest.json')
+        with open(file_name, 'w') as f:
+            json.dump({ 'defaults': { 'steps': steps },
+                        'jobs': [ { 'ply': 'mesh.ply', 'outdir': outdir + '/' } for outdir in outdirs ] }, f)
+        return file_name
+
+    def write_csv_manifest(self, outdirs, steps=3):
+        file_name = os.path.join(self.tmp_dir, 'manifest.csv')
+        with open(file_name, 'w') as f:
+            f.write('ply,outdir,steps,resume\n')
+            for outdir in outdirs:
+                f.write('mesh.ply,%s/,%d,true\n' % (outdir, steps))
+        return file_name
+
+    def run_manifest(self, manifest, max_concurrent=1):
+        jobs = renderjobs.read_manifest(manifest)
+        return jobs, renderjobs.run_jobs(jobs, self.blender, 'script.py', max_concurrent=max_concurrent)
+
+    def test_json_manifest(self):
+        jobs, results = self.run_manifest(self.write_json_manifest([ 'a', 'b' ]))
+
+        self.assertEqual([ job['outdir'] for job in jobs ],
+                         [ os.path.join(self.tmp_dir, 'a') + '/', os.path.join(self.tmp_dir, 'b') + '/' ])
+        self.assertEqual(sorted(r['status'] for r in results), [ 'rendered', 'rendered' ])
+        self.assertTrue(all(renderjobs.job_complete(job) for job in jobs))
+
+    def test_csv_manifest(self):
+        jobs, results = self.run_manifest(self.write_csv_manifest([ 'a', 'b', 'c' ], steps=4))
+
+        self.assertEqual([ job['steps'] for job in jobs ], [ 4, 4, 4 ])
+        self.assertTrue(all(job['resume'] is True for job in jobs))
+        self.assertEqual(sorted(r['status'] for r in results), [ 'rendered' ] * 3)
+        self.assertEqual(len(self.calls()), 3)
+
+    def test_jobs_file_follows_double_dash(self):
+        self.run_manifest(self.write_json_manifest([ 'a' ]))
+
+        calls = self.calls()
+        self.assertEqual(len(calls), 1)
+        argv = calls[0]['argv']
+        self.assertEqual(argv[1:4], [ '--background', '--python', 'script.py' ])
+        self.assertEqual(argv[4], '--')
+        self.assertEqual(argv[5], '--jobs')
+        self.assertEqual(len(argv), 7)
+        self.assertEqual(calls[0]['outdirs'], [ os.path.join(self.tmp_dir, 'a') + '/' ])
+
+        # the jobs file is temporary
+        self.assertFalse(os.path.exists(argv[6]))
+
+    def test_finished_jobs_are_skipped(self):
+        manifest = self.write_json_manifest([ 'a', 'b' ])
+        self.run_manifest(manifest)
+        shutil.rmtree(self.log_dir)
+        os.makedirs(self.log_dir)
+
+        # only the frame that went missing is rendered again
+        os.remove(renderjobs.frame_file_name(os.path.join(self.tmp_dir, 'b') + '/', 2))
+        jobs, results = self.run_manifest(manifest)
+
+        status = { r['job']['outdir']: r['status'] for r in results }
+        self.assertEqual(status[jobs[0]['outdir']], 'skipped')
+        self.assertEqual(status[jobs[1]['outdir']], 'rendered')
+        self.assertEqual([ call['outdirs'] for call in self.calls() ], [ [ jobs[1]['outdir'] ] ])
+        self.assertEqual(renderjobs.render_ranges(jobs[1]), [])
+
+    def test_max_concurrent(self):
+        self.run_manifest(self.write_json_manifest([ 'a', 'b', 'c', 'd', 'e' ]), max_concurrent=2)
+
+        calls = self.calls()
+        self.assertEqual(len(calls), 5)
+
+        # the most blender processes that were running at the same moment
+        events = sorted([ (c['start'], 1) for c in calls ] + [ (c['end'], -1) for c in calls ])
+        running, most = 0, 0
+        for t, change in events:
+            running += change
+            most = max(most, running)
+        self.assertEqual(most, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import fakebpy
+import renderpresets
+import blenderscene
+
+class SetupRenderTest(unittest.TestCase):
+    def setUp(self):
+        fakebpy.install()
+        self.scene = fakebpy.context.scene
+        self.blender_defaults = blenderscene.render_settings()
+
+    def applied(self):
+        scene = self.scene
+        return { 'samples': scene.cycles.samples,
+                 'max_bounces': scene.cycles.max_bounces,
+                 'diffuse_bounces': scene.cycles.diffuse_bounces,
+                 'glossy_bounces': scene.cycles.glossy_bounces,
+                 'transmission_bounces': scene.cycles.transmission_bounces,
+                 'transparent_max_bounces': scene.cycles.transparent_max_bounces,
+                 'tile_size': scene.render.tile_x,
+                 'denoise': scene.render.layers[0].cycles.use_denoising,
+                 'threads': scene.render.threads if scene.render.threads_mode == 'FIXED' else 0 }
+
+    def test_presets(self):
+        for preset in sorted(renderpresets.RENDER_PRESETS):
+            blenderscene.setup_render(renderpresets.render_profile(preset))
+            self.assertEqual(self.applied(), renderpresets.RENDER_PRESETS[preset], preset)
+            self.assertEqual(self.scene.render.tile_y, self.scene.render.tile_x)
+            self.assertEqual(self.scene.render.threads_mode, 'AUTO')
+
+    def test_overrides(self):
+        profile = renderpresets.render_profile('draft', { 'samples': '100', 'threads': 8, 'denoise': 'false' })
+        blenderscene.setup_render(profile)
+
+        expected = dict(renderpresets.RENDER_PRESETS['draft'], samples=100, threads=8, denoise=False)
+        self.assertEqual(self.applied(), expected)
+        self.assertEqual(self.scene.render.threads_mode, 'FIXED')
+
+    def test_no_preset_restores_blender_settings(self):
+        self.assertEqual(renderpresets.render_profile(), {})
+
+        blenderscene.setup_render(renderpresets.render_profile('final'))
+        blenderscene.setup_render(renderpresets.render_profile())
+        self.assertEqual(self.applied(), self.blender_defaults)
+
+        blenderscene.setup_render(renderpresets.render_profile(None, { 'samples': 20 }))
+        self.assertEqual(self.applied(), dict(self.blender_defaults, samples=20))
+
+    def test_bad_settings(self):
+        for preset, overrides in (('ultra', None),
+                                  ('final', { 'sample': 3 }),
+                                  ('final', { 'denoise': 'maybe' })):
+            with self.assertRaises(ValueError):
+                renderpresets.render_profile(preset, overrides)
+
+        for v in ('0', 'false', 'False', 'no', False):
+            self.assertIs(renderpresets.parse_bool(v), False)
+        for v in ('1', 'true', 'TRUE', 'yes', True):
+            self.assertIs(renderpresets.parse_bool(v), True)
+
+if __name__ == "__main__":
+    unittest.main()
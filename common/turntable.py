@@ -0,0 +1,102 @@
+import numpy as np
+
+# camera poses for a turntable, computed without blender.
+#
+# frame f of num_frames sits at angle
+#
+#   start_angle - 2 pi revolutions (f - frame_start) / num_frames
+#
+# so the last frame stops one step short of the first and the clip loops.  the
+# defaults match the bezier circle path: start on -x and go clockwise seen
+# from above.  blender cameras look down their -z axis with +y up, which is
+# what a TRACK_TO constraint with TRACK_NEGATIVE_Z / UP_Y gives.
+
+def turntable_angles(num_frames, revolutions=1.0, start_angle=np.pi, frame_start=1, frames=None):
+    if frames is None:
+        frames = np.arange(frame_start, frame_start + num_frames)
+    t = (np.asarray(frames, dtype=np.float64) - frame_start) / num_frames
+    return start_angle - 2.0 * np.pi * revolutions * t
+
+# positions on a circle of the given radius around center, raised by
+# elevation radians
+def orbit_positions(angles, radius, elevation=0.0, center=(0, 0, 0)):
+    angles = np.asarray(angles, dtype=np.float64)
+    c = np.cos(elevation)
+    return np.asarray(center, dtype=np.float64) + radius * np.column_stack([ c * np.cos(angles),
+                                                                              c * np.sin(angles),
+                                                                              np.full(angles.shape, np.sin(elevation)) ])
+
+# rotation matrices (N,3,3) whose columns are the camera's x, y and z axes,
+# with -z pointing from each position at target and y as close to up as it gets
+def look_at_matrices(positions, target, up=(0, 0, 1)):
+    positions = np.atleast_2d(np.asarray(positions, dtype=np.float64))
+    z = positions - np.asarray(target, dtype=np.float64)
+    z /= np.linalg.norm(z, axis=1)[:,np.newaxis]
+
+    x = np.cross(np.asarray(up, dtype=np.float64), z)
+    norm = np.linalg.norm(x, axis=1)
+    if np.any(norm < 1e-9):
+        raise ValueError("camera looks along the up vector")
+    x /= norm[:,np.newaxis]
+
+    y = np.cross(z, x)
+    return np.stack([ x, y, z ], axis=2)
+
+# blender's default XYZ euler angles (N,3) for rotation matrices (N,3,3),
+# R = Rz(c) Ry(b) Rx(a).  unwrapped along N so keyframes between them don't
+# spin the long way round.
+def matrix_to_euler(matrices):
+    m = np.asarray(matrices, dtype=np.float64)
+    a = np.arctan2(m[:,2,1], m[:,2,2])
+    b = np.arctan2(-m[:,2,0], np.hypot(m[:,0,0], m[:,1,0]))
+    c = np.arctan2(m[:,1,0], m[:,0,0])
+    return np.unwrap(np.column_stack([ a, b, c ]), axis=0)
+
+def euler_to_matrix(euler):
+    euler = np.atleast_2d(np.asarray(euler, dtype=np.float64))
+    ca, cb, cc = np.cos(euler.T)
+    sa, sb, sc = np.sin(euler.T)
+
+    m = np.empty((len(euler), 3, 3))
+    m[:,0,0] = cc * cb
+    m[:,0,1] = cc * sb * sa - sc * ca
+    m[:,0,2] = cc * sb * ca + sc * sa
+    m[:,1,0] = sc * cb
+    m[:,1,1] = sc * sb * sa + cc * ca
+    m[:,1,2] = sc * sb * ca - cc * sa
+    m[:,2,0] = -sb
+    m[:,2,1] = cb * sa
+    m[:,2,2] = cb * ca
+    return m
+
+# location (N,3) and rotation_euler (N,3) of a camera circling target,
+# one row per frame from frame_start
+def camera_poses(num_frames, radius, elevation=0.0, revolutions=1.0, target=(0, 0, 0),
+                 start_angle=np.pi, frame_start=1):
+    angles = turntable_angles(num_frames, revolutions, start_angle, frame_start)
+    locations = orbit_positions(angles, radius, elevation, target)
+    rotations = matrix_to_euler(look_at_matrices(locations, target))
+    return locations, rotations
+
+# the same turntable with the camera held at its first pose: the object turns
+# about the vertical axis through target instead.  the schedule is the z
+# rotation (N,) of the object on each frame, which shows the object to the
+# fixed camera exactly as the orbiting camera sees it.  lights that stay put
+# turn with the camera rather than with the object.
+def object_angles(num_frames, revolutions=1.0, frame_start=1, frames=None):
+    return np.pi - turntable_angles(num_frames, revolutions, np.pi, frame_start, frames)
+
+# rotation_euler (N,3) and location (N,3) of an object whose origin is at
+# origin, turning about the vertical axis through target
+def object_transforms(num_frames, revolutions=1.0, target=(0, 0, 0), origin=(0, 0, 0), frame_start=1):
+    angles = object_angles(num_frames, revolutions, frame_start)
+    c, s = np.cos(angles), np.sin(angles)
+
+    target = np.asarray(target, dtype=np.float64)
+    offset = np.asarray(origin, dtype=np.float64) - target
+    locations = np.column_stack([ target[0] + c * offset[0] - s * offset[1],
+                                  target[1] + s * offset[0] + c * offset[1],
+                                  np.full(angles.shape, target[2] + offset[2]) ])
+
+    rotations = np.column_stack([ np.zeros_like(angles), np.zeros_like(angles), angles ])
+    return rotations, locations
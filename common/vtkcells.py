@@ -0,0 +1,6 @@
+import numpy as np
+import vtk
+
+# numpy dtype of vtkIdType, for building legacy cell arrays in numpy that
+# numpy_to_vtkIdTypeArray can take without a conversion
+ID_DTYPE = np.int64 if vtk.vtkIdTypeArray().GetDataTypeSize() == 8 else np.int32
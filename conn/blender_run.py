@@ -1,146 +1,85 @@
-import bpy
-import math
-import os
-
-def reset_blend():
-    #bpy.ops.wm.read_factory_settings()
-
-    for scene in bpy.data.scenes:
-        for obj in scene.objects:
-            scene.objects.unlink(obj)
-
-    # only worry about data in the startup scene
-    for bpy_data_iter in (
-            bpy.data.objects,
-            bpy.data.meshes,
-            bpy.data.lamps,
-            bpy.data.cameras,
-            bpy.data.curves,
-            bpy.data.materials
-            ):
-        for id_data in bpy_data_iter:
-            bpy_data_iter.remove(id_data)
-
-def add_camera():
-    bpy.ops.object.camera_add()
-    
-    camera = bpy.data.cameras["Camera"]
-    camera.lens = 39.18   
-    
-    scene = bpy.data.scenes[0]
-    camera = bpy.data.objects["Camera"]
-    camera.location = (0,-25,0)   
-
-    bpy.context.scene.camera = camera    
-        
-    return camera
-
-def add_tracker():
-    bpy.ops.mesh.primitive_cube_add()
-    cube = bpy.data.objects['Cube']
-    cube.location = (0,-3.77811,0)
-    cube.scale = (.1,.1,.1)
-    cube.hide_render = True
-    return cube
-    
-def add_lights(tracker):
-    bpy.ops.object.lamp_add(type='AREA')
-    light = bpy.data.objects['Area']
-    light.location = (0,-10.09,8.31)
-
-    track_object_to(light, tracker)
-    
-    # lamp-specific
-    light = bpy.data.lamps['Area']
-    light.shape = 'RECTANGLE'
-    light.size = 12
-    light.size_y = 4
-    light.node_tree.nodes['Emission'].inputs['Strength'].default_value = 5000
-
-    bpy.ops.object.lamp_add(type='SUN')
-    sun = bpy.data.objects['Sun']
-    sun.location = (0,-25.08,0)
-
-    track_object_to(sun, tracker)
-    
-    bpy.ops.object.track_set(type = "TRACKTO")     
-    sun = bpy.data.lamps['Sun']
-    sun.shadow_soft_size = 2.5
-    sun.node_tree.nodes['Emission'].inputs['Strength'].default_value = 0.5    
-
-def add_ply(path, vertex_colors=True):
-    bpy.ops.import_mesh.ply(filepath=path)
-    obj = bpy.context.scene.objects.active
-    obj.location = (0,0,0)
-    bpy.ops.object.shade_smooth()
-    
-    mat = bpy.data.materials.new("Material")
-    mat.use_nodes = True
-    
-    if vertex_colors:
-        nodes = mat.node_tree.nodes
-        links = mat.node_tree.links           
-        
-        nodes.remove(nodes.get('Diffuse BSDF'))
-        
-        att = nodes.new('ShaderNodeAttribute')
-        att.attribute_name = 'Col'
-        
-        glass = nodes.new('ShaderNodeBsdfGlass')
-        glass.inputs['Roughness'].default_value = 0.217
-        glass.inputs['IOR'].default_value = 2.1
-        
-        links.new(att.outputs['Color'], glass.inputs['Color'])
-        
-        material_output = nodes.get('Material Output')
-        links.new(glass.outputs[0], material_output.inputs[0])
-        
-    obj.data.materials.append(mat)
-
-def track_object_to(object, tracker):
-    bpy.ops.object.select_all(action = "DESELECT")
-    object.select = True
-    tracker.select = True
-    bpy.context.scene.objects.active = tracker
-    bpy.ops.object.track_set(type = "TRACKTO")
-
-    
-def render(out_path, dry_run=False):
-    tracker = add_tracker()
-    camera = add_camera()
-    track_object_to(camera, tracker)
-    add_lights(tracker)
-
-    bpy.context.scene.render.filepath = out_path
-    
-    if not dry_run:
-        bpy.ops.render.render(write_still=True)
-
-def setup_world(resolution_x=5940, resolution_y=3600, transparent_background=True, resolution_percentage=100):
-    bpy.context.scene.render.engine = 'CYCLES'
-    bpy.context.scene.render.resolution_x = resolution_x
-    bpy.context.scene.render.resolution_y = resolution_y
-    bpy.context.scene.render.resolution_percentage = resolution_percentage
-    bpy.context.scene.cycles.film_transparent = transparent_background
-    #bpy.data.worlds['World'].light_settings.use_ambient_occlusion = True
-    #bpy.data.worlds['World'].light_settings.ao_factor = 0.4  
-    bpy.data.worlds['World'].horizon_color = (0,0,0)
-
-
-def main():
-    ply_dir = 'C:/Users/davidf/workspace/conn'
-    out_path = 'C:/Users/davidf/workspace/conn/test.png'
-    
-    reset_blend()    
-    setup_world(resolution_percentage=5)
-    
-    for filename in os.listdir(ply_dir):
-        print(filename)
-        if filename.endswith('ply'):
-            add_ply(os.path.join(ply_dir,filename))
-            break
-    
-    render(out_path, dry_run=False)
-    
-if __name__ == "__main__": main()
-
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import renderjobs
+import renderpresets
+import blenderscene
+
+MATERIAL = 'glass'
+
+# settings for the plys next to this script, when no jobs are given
+DEFAULTS = {
+    'steps': 1,
+    'resolution': 5
+    }
+
+# a still of the glass streamlines from a perspective camera in front, lit
+# by a wide area light from above and a weak sun behind the camera.  it is
+# rendered as frame 1 of a one frame animation, to out_path + '0001.png', so
+# renderjobs can resume, verify and cache it like any other job.
+def conn_scene(ply_file, out_path, resolution_percentage=5, preset=renderpresets.DEFAULT_PRESET,
+               render_settings=None, material=MATERIAL, resolution_x=None, resolution_y=None):
+    world = { 'resolution_percentage': resolution_percentage, 'ambient_occlusion': None }
+    if resolution_x is not None:
+        world['resolution_x'] = resolution_x
+    if resolution_y is not None:
+        world['resolution_y'] = resolution_y
+
+    return {
+        'world': blenderscene.world_settings(**world),
+        'render': renderpresets.render_profile(preset, render_settings),
+        'tracker': { 'location': (0,-3.77811,0) },
+        'camera': { 'type': 'PERSP',
+                    'lens': 39.18,
+                    'location': (0,-25,0) },
+        'lights': [ blenderscene.light(type='AREA', location=(0,-10.09,8.31), strength=5000,
+                                       shape='RECTANGLE', size=12, size_y=4),
+                    blenderscene.light(type='SUN', location=(0,-25.08,0), strength=0.5,
+                                       shadow_soft_size=2.5) ],
+        'meshes': [ blenderscene.mesh(ply_file, material=material) ],
+        'output': { 'filepath': out_path,
+                    'animation': True,
+                    'frame_start': 1,
+                    'frame_end': 1 }
+    }
+
+# a job's ply is a ply file, or a directory whose first ply is rendered
+def find_ply(path):
+    if not os.path.isdir(path):
+        return path
+
+    ply_files = sorted(f for f in os.listdir(path) if f.lower().endswith('.ply'))
+    if not ply_files:
+        raise ValueError("no .ply files in %s" % path)
+    return os.path.join(path, ply_files[0])
+
+def job_scene(job):
+    if job['steps'] != 1:
+        raise ValueError("%s: conn renders a still, give its job 'steps': 1" % job['outdir'])
+
+    return conn_scene(find_ply(job['ply']), job['outdir'], job['resolution'], job['preset'],
+                      job['render_settings'], job['material'] or MATERIAL,
+                      job['resolution_x'], job['resolution_y'])
+
+# render the jobs file passed after '--' by renderjobs, or else the first ply
+# next to this script to test_0001.png
+def main():
+    jobs = renderjobs.jobs_from_argv()
+
+    if jobs is None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        jobs = [ renderjobs.make_job({ 'ply': script_dir,
+                                       'outdir': os.path.join(script_dir, 'test_'),
+                                       'resume': False }, DEFAULTS) ]
+
+    for job in jobs:
+        frame_ranges = renderjobs.render_ranges(job)
+        if not frame_ranges:
+            continue
+
+        scene = job_scene(job)
+        blenderscene.apply_scene(scene)
+        blenderscene.render_scene(scene, frame_ranges)
+
+if __name__ == "__main__": main()
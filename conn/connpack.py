@@ -0,0 +1,130 @@
+import os
+import json
+import struct
+import numpy as np
+
+# all experiments' streamlines and injection sites in one file:
+#
+#   MAGIC, uint64 header size, json header, then raw arrays aligned to ALIGN
+#
+# the header maps each array name to its dtype, shape and byte offset.
+#   experiment_ids                (E,)   int64
+#   vertices                      (V,4)  float32, x y z density
+#   line_offsets                  (L+1,) int64, line i is vertices[line_offsets[i]:line_offsets[i+1]]
+#   experiment_line_offsets       (E+1,) int64, experiment e owns lines [e_start, e_end)
+#   injection_sites               (I,3)  float32
+#   experiment_injection_offsets  (E+1,) int64
+MAGIC = b'CONNPACK'
+ALIGN = 64
+
+def write_pack(file_name, experiments):
+    experiments = list(experiments)
+
+    sizes = [ len(line) for _, lines, _ in experiments for line in lines ]
+    lines_per_experiment = [ len(lines) for _, lines, _ in experiments ]
+    ijs_per_experiment = [ len(ijs) for _, _, ijs in experiments ]
+
+    all_lines = [ np.asarray(line, dtype=np.float32).reshape(-1,4) for _, lines, _ in experiments for line in lines ]
+    all_ijs = [ np.asarray(ijs, dtype=np.float32).reshape(-1,3) for _, _, ijs in experiments ]
+
+    def offsets(counts):
+        o = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=o[1:])
+        return o
+
+    arrays = [
+        ('experiment_ids', np.array([ did for did, _, _ in experiments ], dtype=np.int64)),
+        ('vertices', np.concatenate(all_lines) if all_lines else np.zeros((0,4), dtype=np.float32)),
+        ('line_offsets', offsets(sizes)),
+        ('experiment_line_offsets', offsets(lines_per_experiment)),
+        ('injection_sites', np.concatenate(all_ijs) if all_ijs else np.zeros((0,3), dtype=np.float32)),
+        ('experiment_injection_offsets', offsets(ijs_per_experiment))
+    ]
+
+    # lay the arrays out after a header that is padded to a fixed size so
+    # the offsets don't depend on the header's own length
+    header = {}
+    offset = 0
+    for name, values in arrays:
+        header[name] = { 'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': offset }
+        offset += -(-values.nbytes // ALIGN) * ALIGN
+
+    header_bytes = json.dumps(header, sort_keys=True).encode('ascii')
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGN) * ALIGN
+    header_bytes = header_bytes.ljust(data_start - len(MAGIC) - 8)
+
+    tmp_file_name = file_name + ".tmp"
+    with open(tmp_file_name, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name, values in arrays:
+            f.seek(data_start + header[name]['offset'])
+            f.write(np.ascontiguousarray(values).tobytes())
+        f.truncate(data_start + offset)
+    os.rename(tmp_file_name, file_name)
+
+# pack the per-experiment npz files that vtkconn.save_npz writes
+def pack_npz(data_set_ids, file_name, base_dir='.'):
+    def experiments():
+        for did in data_set_ids:
+            with np.load(os.path.join(base_dir, "%d_conn.npz" % did), allow_pickle=True) as data:
+                yield did, list(data['lines']), data['injection_sites']
+
+    write_pack(file_name, experiments())
+
+# read-only, memory-mapped view of a packed file.  everything handed out is a
+# slice of the mapping, so nothing is copied until it's used.
+class ConnectivityPack(object):
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a connectivity pack" % file_name)
+            header_size = struct.unpack('<Q', f.read(8))[0]
+            header = json.loads(f.read(header_size).decode('ascii'))
+
+        data_start = len(MAGIC) + 8 + header_size
+        self.arrays = {}
+        for name, info in header.items():
+            shape = tuple(info['shape'])
+            if np.prod(shape) == 0:
+                self.arrays[name] = np.zeros(shape, dtype=info['dtype'])
+            else:
+                self.arrays[name] = np.memmap(file_name, dtype=info['dtype'], mode='r',
+                                              offset=data_start + info['offset'], shape=shape)
+
+        self.experiment_ids = np.asarray(self.arrays['experiment_ids'])
+        self._index = { int(did): i for i, did in enumerate(self.experiment_ids) }
+
+    def __contains__(self, data_set_id):
+        return data_set_id in self._index
+
+    # line offsets into vertices, vertex range of the experiment's lines
+    def line_offsets(self, data_set_id):
+        e = self._index[data_set_id]
+        elo = self.arrays['experiment_line_offsets']
+        return self.arrays['line_offsets'][elo[e]:elo[e+1]+1]
+
+    # the experiment's vertices as one flat (N,4) array
+    def vertices(self, data_set_id):
+        lo = self.line_offsets(data_set_id)
+        return self.arrays['vertices'][lo[0]:lo[-1]]
+
+    def lines(self, data_set_id, line_indices=None):
+        lo = self.line_offsets(data_set_id)
+        vertices = self.arrays['vertices']
+        if line_indices is None:
+            line_indices = range(len(lo) - 1)
+        return [ vertices[lo[i]:lo[i+1]] for i in line_indices ]
+
+    def injection_sites(self, data_set_id):
+        e = self._index[data_set_id]
+        eio = self.arrays['experiment_injection_offsets']
+        return self.arrays['injection_sites'][eio[e]:eio[e+1]]
+
+# same shape of output as vtkconn.load_npz
+def load_pack(data_set_ids, file_name):
+    pack = ConnectivityPack(file_name)
+    for did in data_set_ids:
+        yield did, { 'lines': pack.lines(did),
+                     'injection_sites': pack.injection_sites(did) }
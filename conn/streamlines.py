@@ -0,0 +1,86 @@
+import numpy as np
+
+# streamlines are (N,4) arrays of x, y, z, density
+
+# douglas-peucker: keep the fewest vertices such that no dropped vertex is
+# further than tolerance from the simplified polyline
+def simplify_line(line, tolerance):
+    n = len(line)
+    if n < 3:
+        return line
+
+    xyz = line[:,:3]
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [ (0, n-1) ]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        a = xyz[first]
+        d = xyz[last] - a
+        p = xyz[first+1:last] - a
+
+        dd = np.dot(d, d)
+        if dd > 0:
+            t = np.clip(np.dot(p, d) / dd, 0, 1)
+            dist = np.sqrt(np.sum((p - t[:,np.newaxis] * d)**2, axis=1))
+        else:
+            dist = np.sqrt(np.sum(p**2, axis=1))
+
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            mid = first + 1 + i
+            keep[mid] = True
+            stack.append((first, mid))
+            stack.append((mid, last))
+
+    return line[keep]
+
+# resample at even arc-length steps of spacing, always keeping both ends
+def resample_line(line, spacing):
+    if len(line) < 2:
+        return line
+
+    s = np.concatenate([ [0], np.cumsum(np.sqrt(np.sum(np.diff(line[:,:3], axis=0)**2, axis=1))) ])
+    if s[-1] <= spacing:
+        return line[[0, -1]]
+
+    samples = np.linspace(0, s[-1], int(np.ceil(s[-1] / spacing)) + 1)
+    return np.column_stack([ np.interp(samples, s, line[:,k]) for k in range(line.shape[1]) ])
+
+# replace density with a tube radius between min_radius and max_radius,
+# scaled by the largest density over all of the lines
+def density_radius(lines, min_radius, max_radius):
+    max_density = max([ line[:,3].max() for line in lines if len(line) ] or [ 0 ])
+    scale = (max_radius - min_radius) / max_density if max_density > 0 else 0
+
+    out = []
+    for line in lines:
+        line = np.array(line, dtype=np.float64)
+        line[:,3] = min_radius + line[:,3] * scale
+        out.append(line)
+
+    return out
+
+# optional streamline preprocessing before tubing: drop lines whose peak density
+# is below min_density, resample and/or simplify the rest, and map density to
+# radius when radius_range=(min_radius, max_radius) is given
+def preprocess_lines(lines, tolerance=None, spacing=None, min_density=None, radius_range=None):
+    lines = [ np.asarray(line, dtype=np.float64).reshape(-1,4) for line in lines ]
+
+    if min_density is not None:
+        lines = [ line for line in lines if len(line) and line[:,3].max() >= min_density ]
+
+    if spacing:
+        lines = [ resample_line(line, spacing) for line in lines ]
+
+    if tolerance:
+        lines = [ simplify_line(line, tolerance) for line in lines ]
+
+    if radius_range is not None:
+        lines = density_radius(lines, radius_range[0], radius_range[1])
+
+    return lines
@@ -0,0 +1,162 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import requests
+import vtkconn
+
+REPLY = { 'args': [ { 'lines': [ [ { 'x': 6600.0, 'y': 4000.0, 'z': 5700.0, 'density': 1.0 },
+                                   { 'x': 6601.0, 'y': 4000.0, 'z': 5700.0, 'density': 0.5 } ] ],
+                      'injection_sites': [ { 'x': 6600.0, 'y': 4000.0, 'z': 5700.0 } ] } ] }
+
+# stands in for the datacube.  each request takes the next status from
+# statuses, and once they run out every request gets a good reply.
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers['Content-Length']))
+        server.requests += 1
+        status = server.statuses.pop(0) if server.statuses else 200
+
+        body = json.dumps(REPLY if status == 200 else { 'error': status }).encode('ascii')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+# fails to connect for the first failures posts, then posts for real
+class FlakySession(object):
+    def __init__(self, failures):
+        self.failures = failures
+        self.attempts = 0
+
+    def post(self, url, **kwargs):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise requests.ConnectionError("connection refused")
+        return requests.post(url, **kwargs)
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.requests = 0
+        self.server.statuses = []
+        self.url = "http://127.0.0.1:%d/call" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.base_dir)
+
+    def test_retries_server_errors(self):
+        self.server.statuses = [ 503, 500 ]
+        data = vtkconn.download(1, url=self.url, retries=3, backoff=0)
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(len(data['lines']), 1)
+        np.testing.assert_allclose(data['lines'][0][1], [ 1e-3, 0, 0, 0.5 ])
+
+    def test_gives_up_after_retries(self):
+        self.server.statuses = [ 503 ] * 3
+        with self.assertRaises(requests.HTTPError):
+            vtkconn.download(1, url=self.url, retries=2, backoff=0)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.statuses = [ 404 ]
+        with self.assertRaises(requests.HTTPError):
+            vtkconn.download(1, url=self.url, retries=3, backoff=0)
+        self.assertEqual(self.server.requests, 1)
+
+    # download through session, recording the backoff sleeps in sleeps
+    # instead of sleeping
+    def download_recording_sleeps(self, session, sleeps, retries, backoff):
+        sleep = vtkconn.time.sleep
+        vtkconn.time.sleep = sleeps.append
+        try:
+            return vtkconn.download(1, session=session, url=self.url, retries=retries, backoff=backoff)
+        finally:
+            vtkconn.time.sleep = sleep
+
+    def test_connection_errors_are_retried(self):
+        session, sleeps = FlakySession(2), []
+        data = self.download_recording_sleeps(session, sleeps, retries=3, backoff=0.5)
+        self.assertEqual(session.attempts, 3)
+        self.assertEqual(sleeps, [ 0.5, 1.0 ])
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(len(data['lines']), 1)
+
+    def test_connection_errors_give_up(self):
+        session, sleeps = FlakySession(10), []
+        with self.assertRaises(requests.ConnectionError):
+            self.download_recording_sleeps(session, sleeps, retries=2, backoff=0.5)
+        self.assertEqual(session.attempts, 3)
+        self.assertEqual(sleeps, [ 0.5, 1.0 ])
+        self.assertEqual(self.server.requests, 0)
+
+    def test_save_npz_replaces_bad_files(self):
+        file_name = vtkconn.npz_file_name(2, self.base_dir)
+        with open(file_name, 'wb') as f:
+            f.write(b'truncated')
+
+        self.server.statuses = [ 404 ]
+        status = vtkconn.save_npz([ 1, 2 ], self.base_dir, workers=1, url=self.url, backoff=0)
+
+        downloaded = [ did for did in status if status[did] == 'downloaded' ]
+        failed = [ did for did in status if status[did] != 'downloaded' ]
+        self.assertEqual(len(downloaded), 1)
+        self.assertEqual(len(failed), 1)
+        self.assertTrue(vtkconn.valid_npz(vtkconn.npz_file_name(downloaded[0], self.base_dir)))
+        self.assertFalse(vtkconn.valid_npz(vtkconn.npz_file_name(failed[0], self.base_dir)))
+        self.assertEqual([ f for f in os.listdir(self.base_dir) if '.tmp' in f ], [])
+
+        # a second pass only fetches the one that failed
+        self.server.requests = 0
+        status = vtkconn.save_npz([ 1, 2 ], self.base_dir, workers=1, url=self.url, backoff=0)
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(status[downloaded[0]], 'existing')
+        self.assertEqual(status[failed[0]], 'downloaded')
+
+    def test_interrupted_write_keeps_old_file(self):
+        file_name = vtkconn.npz_file_name(3, self.base_dir)
+        with open(file_name, 'wb') as f:
+            f.write(b'old')
+
+        data = vtkconn.download(3, url=self.url, backoff=0)
+        savez = np.savez
+        def interrupted(file, **arrays):
+            with open(file, 'wb') as f:
+                f.write(b'partial')
+            raise KeyboardInterrupt()
+        np.savez = interrupted
+        try:
+            with self.assertRaises(KeyboardInterrupt):
+                vtkconn.write_npz(file_name, data)
+        finally:
+            np.savez = savez
+
+        with open(file_name, 'rb') as f:
+            self.assertEqual(f.read(), b'old')
+
+        vtkconn.write_npz(file_name, data)
+        self.assertTrue(vtkconn.valid_npz(file_name))
+        self.assertEqual(os.listdir(self.base_dir), [ os.path.basename(file_name) ])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,19 @@
 import vtk
+import vtk.util.numpy_support
 import os
+import sys
+import time
+import argparse
+import concurrent.futures
 import requests
+import requests.adapters
 import numpy as np
-import allensdk.core.json_utilities as ju
+import connpack
+import streamlines
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import vtkcells
+import batch
 
 DATA_SET_IDS = [100140756,100141219,112162251,114292355,158435116,272916915,127138787,100141454,100141563,180073473,126861679,174361040,272737914,100149969,127866392,139426984,272697944,180673746,113887868,157711748,115958825]
 CENTER = [ 6600.0, 4000.0, 5700.0 ]
@@ -29,71 +40,150 @@ COLORS = { 100140756:(206,4,9),
            115958825:(0,210,205)
 }
 
-def download(data_set_id):
-    res = requests.post("http://datacube.brain-map.org/call",
-                        json={'procedure': 'org.brain_map.locator.get_lines',
-                              'kwargs': { 'id': data_set_id }})
+DATACUBE_URL = "http://datacube.brain-map.org/call"
 
-    data = res.json()['args'][0]
+# turn the get_lines response into arrays, reading every vertex in one pass
+def parse_lines(data):
+    lines = data['lines']
+    sizes = [ len(d) for d in lines ]
 
-    lines = [ np.array([ [v['x'], v['y'], v['z'], v['density']]
-                        for v in d ])
-              for d in data['lines'] ]
+    vertices = np.fromiter((v[k] for d in lines for v in d for k in ('x', 'y', 'z', 'density')),
+                           dtype=np.float64, count=4 * sum(sizes)).reshape(-1, 4)
 
-    ijs = np.array([ [d['x'], d['y'], d['z'] ]
-                     for d in data['injection_sites'] ])
+    ijs = np.fromiter((d[k] for d in data['injection_sites'] for k in ('x', 'y', 'z')),
+                      dtype=np.float64).reshape(-1, 3)
 
     scale = 1e-3
-    
-    for line in lines:
-        line[:,:3] = (line[:,:3] - CENTER) * scale
 
+    vertices[:,:3] = (vertices[:,:3] - CENTER) * scale
     ijs = (ijs - CENTER) * scale
 
-    return { 'lines': lines,
+    return { 'lines': np.split(vertices, np.cumsum(sizes)[:-1]) if sizes else [],
              'injection_sites': ijs }
 
+# connection problems and server errors may clear up.  a 4xx or a malformed
+# reply would only fail the same way again.
+def retryable(error):
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+def download(data_set_id, session=None, url=DATACUBE_URL, retries=3, backoff=1.0):
+    session = session or requests
+
+    for attempt in range(retries + 1):
+        try:
+            res = session.post(url,
+                               json={'procedure': 'org.brain_map.locator.get_lines',
+                                     'kwargs': { 'id': data_set_id }})
+            res.raise_for_status()
+            break
+        except requests.RequestException as e:
+            if attempt == retries or not retryable(e):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+    data = res.json()['args'][0]
 
-def save_npz(data_set_ids, base_dir='.'):    
+    return parse_lines(data)
+
+def npz_file_name(data_set_id, base_dir='.'):
+    return os.path.join(base_dir, "%d_conn.npz" % data_set_id)
+
+def valid_npz(file_name):
+    try:
+        with np.load(file_name, allow_pickle=True) as data:
+            return data['injection_sites'].ndim == 2 and data['lines'].ndim == 1
+    except Exception:
+        return False
+
+def write_npz(file_name, data):
+    # ragged lines are stored as an object array
+    lines = np.empty(len(data['lines']), dtype=object)
+    for i, line in enumerate(data['lines']):
+        lines[i] = line
+
+    # write next to the target and move it into place, so an interrupted
+    # download never leaves a truncated file behind
+    tmp_file_name = file_name + ".tmp.npz"
+    np.savez(tmp_file_name, lines=lines, injection_sites=data['injection_sites'])
+    os.rename(tmp_file_name, file_name)
+
+# download every data set that doesn't already have a valid npz in base_dir,
+# several at a time over one pooled session.  returns data set id -> one of
+# 'existing', 'downloaded' or the exception that stopped it.
+def save_npz(data_set_ids, base_dir='.', workers=4, url=DATACUBE_URL, retries=3, backoff=1.0):
+    status = {}
+    pending = []
     for did in data_set_ids:
-        data = download(did)
+        if valid_npz(npz_file_name(did, base_dir)):
+            status[did] = 'existing'
+        else:
+            pending.append(did)
 
-        print(did)
-        np.savez(os.path.join(base_dir, "%d_conn.npz" % did), **data)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def fetch(did):
+        data = download(did, session=session, url=url, retries=retries, backoff=backoff)
+        write_npz(npz_file_name(did, base_dir), data)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = { executor.submit(fetch, did): did for did in pending }
+        for future in concurrent.futures.as_completed(futures):
+            did = futures[future]
+            error = future.exception()
+            status[did] = 'downloaded' if error is None else error
+            print(did, 'downloaded' if error is None else 'failed: %s' % error)
+
+    session.close()
+
+    return status
 
 def load_npz(data_set_ids, base_dir='.'):
     for did in data_set_ids:
-        yield did, np.load(os.path.join(base_dir, "%d_conn.npz" % did) )
+        yield did, np.load(npz_file_name(did, base_dir), allow_pickle=True)
+
+# legacy vtkCellArray layout ( n, p1, p2, ..., n, p1, p2, ... ) for cells of
+# the given sizes covering consecutive point ids
+def cell_array(sizes):
+    sizes = np.asarray(sizes, dtype=np.int64)
+
+    cells = np.empty(int(sizes.sum() + sizes.size), dtype=vtkcells.ID_DTYPE)
+    headers = np.cumsum(sizes + 1) - (sizes + 1)
+    is_header = np.zeros(cells.size, dtype=bool)
+    is_header[headers] = True
+
+    cells[headers] = sizes
+    cells[~is_header] = np.arange(sizes.sum())
+
+    ca = vtk.vtkCellArray()
+    ca.SetCells(sizes.size, vtk.util.numpy_support.numpy_to_vtkIdTypeArray(cells, deep=True))
+    return ca
 
 def generate_lines(lines, color):
+    ns = vtk.util.numpy_support
+
+    lines = [ np.asarray(line, dtype=np.float64).reshape(-1,4) for line in lines ]
+    sizes = [ len(line) for line in lines ]
+    vertices = np.concatenate(lines) if lines else np.zeros((0,4))
+
     vtkpoints = vtk.vtkPoints()
-    vtklines = vtk.vtkCellArray()
+    vtkpoints.SetData(ns.numpy_to_vtk(vertices[:,:3].astype(np.float32), deep=True))
 
-    vtkradii = vtk.vtkDoubleArray()
-    vtkradii.SetNumberOfComponents(1)
+    vtkradii = ns.numpy_to_vtk(np.ascontiguousarray(vertices[:,3]), deep=True, array_type=vtk.VTK_DOUBLE)
     vtkradii.SetName("radius")
 
-    colors = vtk.vtkUnsignedCharArray()
-    colors.SetNumberOfComponents(3)
+    point_colors = np.empty((vertices.shape[0], 3), dtype=np.uint8)
+    point_colors[:] = np.asarray(color)[:3]
+    colors = ns.numpy_to_vtk(point_colors, deep=False, array_type=vtk.VTK_UNSIGNED_CHAR)
     colors.SetName("colors")
 
-    for line in lines:
-        line_pids = []
-        for v in line:
-            pid = vtkpoints.InsertNextPoint(v[0], v[1], v[2])
-                
-            vtkradii.InsertNextTuple1(v[3])
-            colors.InsertNextTuple3(color[0], color[1], color[2])
-            
-            line_pids.append(pid)
-
-        vtklines.InsertNextCell(len(line_pids))
-        for pid in line_pids:
-            vtklines.InsertCellPoint(pid)
-
     polyData = vtk.vtkPolyData()
     polyData.SetPoints(vtkpoints)
-    polyData.SetLines(vtklines)
+    polyData.SetLines(cell_array(sizes))
     polyData.GetPointData().AddArray(vtkradii)
     polyData.GetPointData().AddArray(colors)
     polyData.GetPointData().SetActiveScalars("radius")
@@ -137,9 +227,10 @@ def generate_sphere(pos, radius, color):
     pd.GetPointData().AddArray(colors)
     return pd
 
-def generate_mesh(lines, sphere_pos, color, line_radius=0.01, sphere_radius=0.1):
+# line_radius=None tubes each vertex with its own radius scalar
+def generate_mesh(lines, sphere_pos, color, line_radius=0.01, sphere_radius=0.1, sides=6):
     pd = generate_lines(lines, color)
-    tpd = generate_tube(pd, radius=line_radius)
+    tpd = generate_tube(pd, sides=sides, radius=line_radius)
     spd = generate_sphere(sphere_pos, sphere_radius, color)
     
     f = vtk.vtkAppendPolyData()
@@ -149,7 +240,7 @@ def generate_mesh(lines, sphere_pos, color, line_radius=0.01, sphere_radius=0.1)
 
     return f.GetOutput()
 
-def write_ply(pd, filename):
+def write_ply(pd, filename, binary=True):
     f = vtk.vtkTriangleFilter()
     f.SetInputData(pd)
     f.Update()
@@ -158,34 +249,123 @@ def write_ply(pd, filename):
     w.SetFileName(filename)
     w.SetInputData(f.GetOutput())
     w.SetArrayName("colors")
-    w.SetFileTypeToASCII()
+    if binary:
+        w.SetFileTypeToBinary()
+        w.SetDataByteOrderToLittleEndian()
+    else:
+        w.SetFileTypeToASCII()
     w.Update()        
 
-if __name__ == "__main__":
-    base_dir = 'conn'
-    injections_file = os.path.join(base_dir, "experiments.json")
+# injection sphere at the mean of the injection voxels, with the volume of all of them
+def injection_sphere(injection_sites):
+    injection_voxel = injection_sites.mean(axis=0)
+    v = injection_sites.shape[0]
+    r_vox = np.power(3.0/4.0 * v / np.pi, 1.0/3.0)
+    r = r_vox * 1e2 * 1e-3
 
-    #save_npz(DATA_SET_IDS, base_dir=base_dir)
+    return injection_voxel, r
 
-    #r = requests.get("http://api.brain-map.org/api/v2/data/ApiConnectivity/query.json?num_rows=3000")
-    #d = r.json()
-    #ju.write(injections_file, d['msg'])
-    
-    injection_voxels = ju.read(injections_file)
-    injection_voxels = { d['data_set_id']: [ (d['injection_x']-CENTER[0])*1e-3,
-                                             (d['injection_y']-CENTER[1])*1e-3,
-                                             (d['injection_z']-CENTER[2])*1e-3 ] for d in injection_voxels }
-    
-    for did, data in load_npz(DATA_SET_IDS, base_dir=base_dir):
-        print(did)
-
-        injection_voxel = data['injection_sites'].mean(axis=0)
-        v = data['injection_sites'].shape[0]
-        r_vox = np.power(3.0/4.0 * v / np.pi, 1.0/3.0)
-        r = r_vox * 1e2 * 1e-3
-
-        color = np.array(COLORS[did])
-        
-        pd = generate_mesh(data['lines'], injection_voxel,
-                           color=color, line_radius=0.01, sphere_radius=r)
-        write_ply(pd, os.path.join(base_dir, "%d.ply" % did))
+# preprocess holds streamlines.preprocess_lines arguments.  when it maps
+# density to radius, the tubes follow it instead of using line_radius.
+def build_experiment_mesh(did, pack_file, base_dir, line_radius=0.01, binary=True, preprocess=None, sides=6):
+    pack = connpack.ConnectivityPack(pack_file)
+
+    injection_voxel, r = injection_sphere(pack.injection_sites(did))
+    color = np.array(COLORS[did])
+
+    lines = pack.lines(did)
+    if preprocess:
+        lines = streamlines.preprocess_lines(lines, **preprocess)
+        if preprocess.get('radius_range') is not None:
+            line_radius = None
+
+    pd = generate_mesh(lines, injection_voxel,
+                       color=color, line_radius=line_radius, sphere_radius=r, sides=sides)
+
+    ply_file = os.path.join(base_dir, "%d.ply" % did)
+    write_ply(pd, ply_file, binary=binary)
+
+    return ply_file
+
+def build_experiment_mesh_task(*args):
+    return { 'ply_file': build_experiment_mesh(*args) }
+
+def describe_experiment_result(result):
+    if result['error'] is not None:
+        return str(result['data_set_id'])
+    return result['ply_file']
+
+def build_experiment_meshes(data_set_ids, pack_file, base_dir, workers=1, line_radius=0.01, binary=True,
+                            preprocess=None, sides=6):
+    tasks = [ (build_experiment_mesh_task,
+               (did, pack_file, base_dir, line_radius, binary, preprocess, sides),
+               { 'data_set_id': did, 'ply_file': None })
+              for did in data_set_ids ]
+
+    return batch.run_tasks(tasks, workers, describe=describe_experiment_result, show_errors=True)
+
+# append several of our plys into one, for a single import into blender.
+# the meshes are built in pool workers and only their files come back to
+# this process, so they are read back in here.
+def merge_plys(ply_files, file_name, binary=True):
+    f = vtk.vtkAppendPolyData()
+
+    for ply_file in ply_files:
+        r = vtk.vtkPLYReader()
+        r.SetFileName(ply_file)
+        r.Update()
+
+        pd = r.GetOutput()
+        # the reader calls vertex colors RGB
+        colors = pd.GetPointData().GetArray("RGB")
+        if colors is not None:
+            colors.SetName("colors")
+
+        f.AddInputData(pd)
+
+    f.Update()
+    write_ply(f.GetOutput(), file_name, binary=binary)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base_dir', default='conn')
+    parser.add_argument('--workers', default=1, type=int)
+    parser.add_argument('--line_radius', default=0.01, type=float)
+    parser.add_argument('--sides', default=6, type=int)
+    parser.add_argument('--simplify', default=None, type=float, help='douglas-peucker tolerance')
+    parser.add_argument('--resample', default=None, type=float, help='arc-length resampling step')
+    parser.add_argument('--min_density', default=None, type=float, help='drop streamlines below this peak density')
+    parser.add_argument('--density_radius', default=None, type=float, nargs=2, metavar=('MIN', 'MAX'),
+                        help='map density to tube radius in [MIN, MAX]')
+    parser.add_argument('--merged', default=None, help='also write all experiments to this ply')
+    parser.add_argument('--ascii', action='store_true')
+    args = parser.parse_args()
+
+    pack_file = os.path.join(args.base_dir, "conn.pack")
+
+    #save_npz(DATA_SET_IDS, base_dir=args.base_dir)
+
+    if not os.path.exists(pack_file):
+        connpack.pack_npz(DATA_SET_IDS, pack_file, base_dir=args.base_dir)
+
+    preprocess = dict(tolerance=args.simplify,
+                      spacing=args.resample,
+                      min_density=args.min_density,
+                      radius_range=args.density_radius)
+    if all(v is None for v in preprocess.values()):
+        preprocess = None
+
+    start = time.time()
+    results = build_experiment_meshes(DATA_SET_IDS, pack_file, args.base_dir, workers=args.workers,
+                                      line_radius=args.line_radius, binary=not args.ascii,
+                                      preprocess=preprocess, sides=args.sides)
+
+    ply_files = [ r['ply_file'] for r in sorted(results, key=lambda r: DATA_SET_IDS.index(r['data_set_id']))
+                  if r['error'] is None ]
+    batch.print_summary(batch.summarize(results, time.time() - start, 'experiments'), 'experiments')
+
+    if args.merged:
+        merge_plys(ply_files, args.merged, binary=not args.ascii)
+        print(args.merged)
+
+if __name__ == "__main__": main()
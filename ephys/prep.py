@@ -1,41 +1,25 @@
+import os, sys
+import argparse
+import numpy as np
 import pandas as pd
-import vtk
 
-file_name = "ephys_cells.csv"
-
-df = pd.read_csv(file_name)
-
-append = vtk.vtkAppendPolyData()
-writer = vtk.vtkPLYWriter()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import spheres
+import plyio
 
-for i,row in df.iterrows():
-    print(i)
-    s = vtk.vtkSphereSource()
-    s.SetRadius(0.05)
-    s.SetCenter(row['y'], row['x'], row['z'])
-    s.SetThetaResolution(16)
-    s.SetPhiResolution(8)
-    s.Update()
+parser = argparse.ArgumentParser()
+parser.add_argument('--ascii', action='store_true')
+args = parser.parse_args()
 
-    pd = s.GetOutput()
-    colors = vtk.vtkUnsignedCharArray()
-    colors.SetNumberOfComponents(3)
-    colors.SetName("colors")
-
-    points = pd.GetPoints()
-    for i in range(points.GetNumberOfPoints()):
-        colors.InsertNextTuple3(row['r']*255, row['g']*255, row['b']*255)
-
-    pd.GetPointData().AddArray(colors)
-    
-    append.AddInputData(pd)
+file_name = "ephys_cells.csv"
 
-append.Update()
+df = pd.read_csv(file_name)
 
-writer.SetFileName("geo.ply")
-writer.SetArrayName("colors")
-writer.SetFileTypeToASCII()
+centers = df[['y','x','z']].values
+colors = (df[['r','g','b']].values * 255).astype(np.uint8)
 
-writer.SetInputConnection(append.GetOutputPort())
-writer.Write()
+points, faces, point_colors = spheres.sphere_cloud(centers, 0.05, colors,
+                                                   theta_resolution=16, phi_resolution=8)
+print("%d cells, %d triangles" % (len(df), faces.shape[0]))
 
+plyio.write_ply("geo.ply", points, faces, point_colors, binary=not args.ascii)